@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, MenuItem, Cart, CartItem, Order, OrderItem
+from django.utils import timezone
+from .models import Category, MenuItem, Cart, CartItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySalesSummary, Task
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -19,8 +20,13 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['user', 'created_at', 'updated_at']
+    list_display = ['user', 'item_count', 'total', 'created_at', 'updated_at']
+    readonly_fields = ['item_count', 'total']
     inlines = [CartItemInline]
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.recalculate()
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -34,4 +40,49 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['token_number', 'customer_name', 'customer_phone']
     readonly_fields = ['token_number', 'subtotal', 'tax', 'total', 'created_at']
     inlines = [OrderItemInline]
-    list_editable = ['status']
\ No newline at end of file
+    list_editable = ['status']
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    readonly_fields = ['menu_item_name', 'quantity', 'price', 'subtotal']
+    fields = readonly_fields
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['token_number', 'customer_name', 'status', 'payment_method', 'total', 'created_at', 'archived_at']
+    list_filter = ['status', 'payment_method', 'created_at']
+    search_fields = ['token_number', 'customer_name', 'customer_phone']
+    inlines = [ArchivedOrderItemInline]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(DailySalesSummary)
+class DailySalesSummaryAdmin(admin.ModelAdmin):
+    list_display = ['date', 'revenue', 'order_count', 'completed_count', 'pending_count', 'preparing_count', 'ready_count', 'cancelled_count']
+    date_hierarchy = 'date'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'updated_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'updated_at']
+    actions = ['retry_now']
+    
+    @admin.action(description='Retry selected tasks now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='running').update(status='queued', run_at=timezone.now(), attempts=0)
+        self.message_user(request, f'{updated} task(s) queued.')
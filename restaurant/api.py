@@ -0,0 +1,167 @@
+"""
+Read-only JSON API for kiosks, mobile clients and display boards.
+
+All views are async. Every endpoint accepts ``?fields=a,b,c`` to trim the
+payload to the fields a client actually polls for, and responses are
+encoded without whitespace.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_GET
+
+from .catalog import get_catalog
+from .models import Order
+from .routers import replica_reads
+from .search import MAX_RESULTS, get_search_index
+
+COMPACT = {'separators': (',', ':')}
+
+CATEGORY_FIELDS = {
+    'id': lambda category: category.id,
+    'name': lambda category: category.name,
+    'description': lambda category: category.description,
+}
+
+MENU_ITEM_FIELDS = {
+    'id': lambda item: item.id,
+    'name': lambda item: item.name,
+    'description': lambda item: item.description,
+    'price': lambda item: str(item.price),
+    'category_id': lambda item: item.category_id,
+    'category': lambda item: item.category.name,
+    'image': lambda item: item.image.url if item.image else None,
+    'updated_at': lambda item: item.updated_at.isoformat(),
+}
+
+ORDER_STATUS_FIELDS = {
+    'token_number': lambda order: order.token_number,
+    'status': lambda order: order.status,
+    'created_at': lambda order: order.created_at.isoformat(),
+    'updated_at': lambda order: order.updated_at.isoformat(),
+}
+
+ORDER_FIELDS = {
+    **ORDER_STATUS_FIELDS,
+    'id': lambda order: order.id,
+    'customer_name': lambda order: order.customer_name,
+    'payment_method': lambda order: order.payment_method,
+    'subtotal': lambda order: str(order.subtotal),
+    'tax': lambda order: str(order.tax),
+    'total': lambda order: str(order.total),
+}
+
+MAX_RECENT_ORDERS = 50
+SEARCH_FIELDS = ('id', 'name', 'category', 'price')
+
+_menu_payloads = {}
+
+
+class FieldError(ValueError):
+    pass
+
+
+def parse_fields(request, available, default=None):
+    requested = request.GET.get('fields')
+    if not requested:
+        return tuple(default or available)
+    fields = tuple(name.strip() for name in requested.split(',') if name.strip())
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise FieldError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(available)}.')
+    return fields
+
+
+def serialize(obj, available, fields):
+    return {name: available[name](obj) for name in fields}
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status, json_dumps_params=COMPACT)
+
+
+def menu_payload(catalog, category, fields):
+    # Serialized once per catalog version and field selection.
+    key = (catalog.version, category, fields)
+    payload = _menu_payloads.get(key)
+    if payload is None:
+        items = catalog.items if category is None else catalog.items_for(category)
+        payload = {
+            'version': catalog.version,
+            'categories': [serialize(c, CATEGORY_FIELDS, CATEGORY_FIELDS) for c in catalog.categories],
+            'items': [serialize(item, MENU_ITEM_FIELDS, fields) for item in items],
+        }
+        if len(_menu_payloads) > 256:
+            _menu_payloads.clear()
+        _menu_payloads[key] = payload
+    return payload
+
+
+@require_GET
+async def menu(request):
+    try:
+        fields = parse_fields(request, MENU_ITEM_FIELDS)
+        category = request.GET.get('category')
+        # Parsed up front: the ETag and the payload cache are keyed by it.
+        category = int(category) if category else None
+    except FieldError as e:
+        return error(str(e), 400)
+    except ValueError:
+        return error('category must be an integer.', 400)
+    catalog = await sync_to_async(get_catalog)()
+    etag = f'"{catalog.version}-{"" if category is None else category}-{",".join(fields)}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        payload = menu_payload(catalog, category, fields)
+        response = JsonResponse(payload, json_dumps_params=COMPACT)
+    response['ETag'] = etag
+    return response
+
+
+@require_GET
+async def menu_search(request):
+    try:
+        fields = parse_fields(request, MENU_ITEM_FIELDS, SEARCH_FIELDS)
+        limit = min(int(request.GET.get('limit', 10)), MAX_RESULTS)
+    except FieldError as e:
+        return error(str(e), 400)
+    except ValueError:
+        return error('limit must be an integer.', 400)
+    index = await sync_to_async(get_search_index)()
+    items = index.search(request.GET.get('q', ''), max(limit, 0))
+    return JsonResponse({
+        'version': index.version,
+        'items': [serialize(item, MENU_ITEM_FIELDS, fields) for item in items],
+    }, json_dumps_params=COMPACT)
+
+
+@require_GET
+async def order_status(request, token):
+    try:
+        fields = parse_fields(request, ORDER_STATUS_FIELDS)
+    except FieldError as e:
+        return error(str(e), 400)
+    if not token.startswith('#'):
+        token = f'#{token}'
+    order = await Order.objects.only(*ORDER_STATUS_FIELDS).filter(token_number=token).afirst()
+    if order is None:
+        return error('Order not found.', 404)
+    return JsonResponse(serialize(order, ORDER_STATUS_FIELDS, fields), json_dumps_params=COMPACT)
+
+
+@require_GET
+async def recent_orders(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return error('Authentication required.', 401)
+    try:
+        fields = parse_fields(request, ORDER_FIELDS)
+        limit = min(int(request.GET.get('limit', 10)), MAX_RECENT_ORDERS)
+    except FieldError as e:
+        return error(str(e), 400)
+    except ValueError:
+        return error('limit must be an integer.', 400)
+    orders = Order.objects.filter(user=user).order_by('-created_at', '-id')[:max(limit, 0)]
+    with replica_reads():
+        payload = {'orders': [serialize(order, ORDER_FIELDS, fields) async for order in orders]}
+    return JsonResponse(payload, json_dumps_params=COMPACT)
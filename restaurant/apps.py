@@ -1,5 +1,8 @@
-from django.apps import AppConfig
-
-
-class RestaurantConfig(AppConfig):
-    name = 'restaurant'
+from django.apps import AppConfig
+
+
+class RestaurantConfig(AppConfig):
+    name = 'restaurant'
+
+    def ready(self):
+        from . import archive, recommendations, signals, tasks  # noqa: F401
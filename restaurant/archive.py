@@ -0,0 +1,135 @@
+"""
+Archiving closed orders.
+
+``archive_orders()`` moves completed and cancelled orders older than
+``settings.ORDER_ARCHIVE_AFTER_DAYS`` from ``Order``/``OrderItem`` into
+``ArchivedOrder``/``ArchivedOrderItem``, keeping their ids and tokens. Each
+batch is copied and deleted in its own transaction, so a run can be
+stopped at any point and picked up again by the next one. The task worker
+runs it every ``settings.ORDER_ARCHIVE_INTERVAL`` seconds; the
+``archive_orders`` command runs it by hand.
+
+Archived orders keep their place everywhere a customer or manager looks:
+``find_order()`` falls back to the archive for receipts, ``order_history_page()``
+merges both tables for order history, exports read both, and the daily
+sales rollup keeps counting them (archiving does not touch it, and
+``rebuild_daily_sales()`` reads the archive too).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .db import retry_on_busy
+from .pagination import encode_cursor, keyset_page
+from .rollups import ACTIVE_STATUSES
+from .tasks import task
+
+BATCH_SIZE = 500
+ORDER_FIELDS = [
+    'id', 'user_id', 'token_number', 'customer_name', 'customer_phone', 'customer_email', 'notes',
+    'payment_method', 'status', 'subtotal', 'tax', 'total', 'created_at', 'updated_at',
+]
+ITEM_FIELDS = ['order_id', 'menu_item_id', 'menu_item_name', 'quantity', 'price', 'subtotal']
+
+_archiving = ContextVar('restaurant_archiving_orders', default=False)
+
+
+def is_archiving():
+    """True while orders are being moved, so deletion side effects can be skipped."""
+    return _archiving.get()
+
+
+@contextmanager
+def _moving():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 180)
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_orders(cutoff):
+    from .models import Order
+
+    return Order.objects.filter(created_at__lt=cutoff).exclude(status__in=ACTIVE_STATUSES)
+
+
+@retry_on_busy
+def _archive_batch(cutoff, batch_size):
+    from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+    with transaction.atomic():
+        orders = list(archivable_orders(cutoff).order_by('pk').values(*ORDER_FIELDS)[:batch_size])
+        if not orders:
+            return 0
+        order_ids = [order['id'] for order in orders]
+        items = OrderItem.objects.filter(order_id__in=order_ids).order_by('pk').values(*ITEM_FIELDS)
+        ArchivedOrder.objects.bulk_create(ArchivedOrder(**order) for order in orders)
+        ArchivedOrderItem.objects.bulk_create(ArchivedOrderItem(**item) for item in items)
+        with _moving():
+            # The rollup keeps counting archived orders, so skip its delete hook.
+            Order.objects.filter(pk__in=order_ids).delete()
+    return len(orders)
+
+
+def archive_orders(days=None, batch_size=BATCH_SIZE, limit=None, log=None):
+    """Move closed orders older than ``days`` into the archive; returns how many moved."""
+    cutoff = archive_cutoff(days)
+    moved = 0
+    while limit is None or moved < limit:
+        count = _archive_batch(cutoff, batch_size if limit is None else min(batch_size, limit - moved))
+        if not count:
+            break
+        moved += count
+        if log:
+            log(f'Archived {moved} orders')
+    return moved
+
+
+@task(every=lambda: getattr(settings, 'ORDER_ARCHIVE_INTERVAL', 3600))
+def archive_old_orders():
+    archive_orders()
+
+
+def find_order(user, order_id):
+    """The user's order with ``order_id``, live or archived, or None."""
+    from .models import ArchivedOrder, Order
+
+    return (
+        Order.objects.filter(pk=order_id, user=user).first()
+        or ArchivedOrder.objects.filter(pk=order_id, user=user).first()
+    )
+
+
+def order_history_page(user, cursor=None, per_page=20, expand=False):
+    """One keyset page of ``user``'s orders, newest first, across both tables.
+
+    Returns ``(orders, next_cursor)`` like ``keyset_page()``; the cursor is a
+    position in time, so it means the same thing to both tables.
+    """
+    from .models import ArchivedOrder, Order
+
+    rows, more = [], False
+    for model in (Order, ArchivedOrder):
+        orders = model.objects.filter(user=user).annotate(item_count=Count('items'))
+        if expand:
+            orders = orders.prefetch_related('items')
+        page, next_cursor = keyset_page(orders, cursor, per_page)
+        rows.extend(page)
+        more = more or next_cursor is not None
+    rows.sort(key=lambda order: (order.created_at, order.pk), reverse=True)
+    if more or len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
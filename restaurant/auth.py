@@ -0,0 +1,78 @@
+"""
+Per-process cache of logged-in users.
+
+``AuthenticationMiddleware`` loads the session's ``User`` row on every
+request that touches ``request.user``. ``CachedModelBackend`` keeps the rows
+it loads for ``settings.AUTH_USER_CACHE_SECONDS`` and hands each request its
+own copy, so permission caches and edits never leak between requests.
+Saving or deleting a user drops it here at once (see ``signals.py``); other
+worker processes pick the change up when their entry expires, so keep the
+TTL short. ``0`` turns the cache off.
+"""
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.db import transaction
+
+MAX_USERS = 10000
+
+_users = {}
+
+
+def _ttl():
+    return getattr(settings, 'AUTH_USER_CACHE_SECONDS', 0)
+
+
+def _cached(user_id):
+    entry = _users.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return copy.copy(entry[1])
+    return None
+
+
+def _remember(user_id, user):
+    if len(_users) >= MAX_USERS:
+        now = time.monotonic()
+        for key in [key for key, (expires, cached) in list(_users.items()) if expires <= now]:
+            _users.pop(key, None)
+        if len(_users) >= MAX_USERS:
+            _users.clear()
+    _users[user_id] = (time.monotonic() + _ttl(), user)
+    return copy.copy(user)
+
+
+def forget_user(*user_ids):
+    def forget():
+        for user_id in user_ids:
+            _users.pop(user_id, None)
+    # Again after commit, so a concurrent read cannot re-cache the old row.
+    forget()
+    transaction.on_commit(forget)
+
+
+def clear_user_cache():
+    _users.clear()
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not _ttl():
+            return super().get_user(user_id)
+        user = _cached(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user = _remember(user_id, user)
+        return user
+
+    async def aget_user(self, user_id):
+        if not _ttl():
+            return await super().aget_user(user_id)
+        user = _cached(user_id)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                user = _remember(user_id, user)
+        return user
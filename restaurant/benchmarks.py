@@ -0,0 +1,336 @@
+"""
+Load benchmarks for the ordering flow.
+
+``seed()`` tops the database up to a synthetic dataset built from a fixed
+random seed, and ``run()`` drives the customer-facing views with concurrent
+simulated users through the test client, recording latency percentiles and
+query counts per scenario. The ``benchmark`` management command wraps both,
+writes the results to JSON and compares them against a previous run.
+
+``startup()`` boots ``WSGI_APPLICATION`` in fresh interpreters and times
+the first request, for the ``benchmark_startup`` command.
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .catalog import invalidate_catalog
+from .instrumentation import percentile
+from .models import Cart, Category, MenuItem, Order, OrderItem
+from .recommendations import update_recommendations
+from .rollups import rebuild_daily_sales
+from .search import tokenize
+from .services import increment_cart_item, split_totals
+
+BATCH_SIZE = 5000
+USER_PREFIX = 'bench-user-'
+STAFF_USERNAME = 'bench-staff'
+TOKEN_PREFIX = '#B'
+SCENARIOS = ('menu', 'search', 'cart', 'checkout', 'orders', 'analytics')
+PERCENTILES = (50, 90, 95, 99)
+STATUS_WEIGHTS = {'completed': 85, 'cancelled': 5, 'pending': 4, 'preparing': 3, 'ready': 3}
+
+CHECKOUT_DATA = {
+    'customer_name': 'Benchmark Customer',
+    'customer_phone': '555-0100',
+    'customer_email': 'bench@example.com',
+    'payment_method': 'card',
+    'notes': '',
+}
+
+
+def use_sqlite_file(path, profile=None):
+    """Point the default alias at the SQLite file ``path``.
+
+    ``profile``, if given, replaces the configured connection settings
+    (``OPTIONS``, ``CONN_MAX_AGE``, ...); ``{}`` means Django's defaults.
+    Call this before anything connects; the project database is never
+    touched afterwards.
+    """
+    if connections['default'].vendor != 'sqlite':
+        raise ValueError('Benchmarks run against a SQLite file; the default database is not SQLite.')
+    config = connections['default'].settings_dict
+    config['NAME'] = str(path)
+    if profile is not None:
+        config.update({'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}, **profile)
+    settings.DATABASES['default'] = config
+    connections.close_all()
+
+
+def prepare_environment():
+    """Keep benchmark cache keys apart from the site's and let the test client in."""
+    for config in settings.CACHES.values():
+        if not config.get('KEY_PREFIX', '').startswith('benchmark'):
+            config['KEY_PREFIX'] = f'benchmark{config.get("KEY_PREFIX", "")}'
+    if 'testserver' not in settings.ALLOWED_HOSTS:
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+
+@contextmanager
+def explicit_timestamps(model):
+    # bulk_create would otherwise stamp every row with the current time.
+    fields = [f for f in model._meta.concrete_fields if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _batches(total, start=0):
+    for offset in range(start, total, BATCH_SIZE):
+        yield range(offset, min(offset + BATCH_SIZE, total))
+
+
+def seed(items=10000, users=100000, orders=1000000, categories=50, random_seed=0, log=None):
+    """Create whatever is missing to reach the requested row counts.
+
+    Rows from earlier runs are kept, so seeding an existing benchmark
+    database again only costs a few counts.
+    """
+    log = log or (lambda message: None)
+    now = timezone.now()
+
+    existing = Category.objects.count()
+    if existing < categories:
+        Category.objects.bulk_create(
+            Category(name=f'Category {n}', description=f'Benchmark category {n}') for n in range(existing, categories)
+        )
+    category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True)[:categories])
+
+    existing = MenuItem.objects.count()
+    if existing < items:
+        log(f'Creating {items - existing} menu items')
+        rng = random.Random(f'{random_seed}-items-{existing}')
+        for batch in _batches(items, existing):
+            MenuItem.objects.bulk_create(
+                MenuItem(
+                    category_id=category_ids[n % len(category_ids)],
+                    name=f'Item {n}',
+                    description=f'Benchmark menu item {n}',
+                    price=Decimal(rng.randrange(200, 3000)) / 100,
+                    is_available=rng.random() > 0.05,
+                )
+                for n in batch
+            )
+        invalidate_catalog()
+
+    existing = User.objects.filter(username__startswith=USER_PREFIX).count()
+    if existing < users:
+        log(f'Creating {users - existing} users')
+        password = make_password('bench')
+        for batch in _batches(users, existing):
+            User.objects.bulk_create(User(username=f'{USER_PREFIX}{n}', password=password) for n in batch)
+    if not User.objects.filter(username=STAFF_USERNAME).exists():
+        User.objects.create_user(STAFF_USERNAME, password='bench', is_staff=True)
+
+    existing = Order.objects.filter(token_number__startswith=TOKEN_PREFIX).count()
+    if existing < orders:
+        log(f'Creating {orders - existing} orders')
+        rng = random.Random(f'{random_seed}-orders-{existing}')
+        user_ids = list(User.objects.filter(username__startswith=USER_PREFIX).values_list('pk', flat=True))
+        menu = list(MenuItem.objects.values_list('pk', 'name', 'price'))
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        with explicit_timestamps(Order):
+            for batch in _batches(orders, existing):
+                rows = []
+                for n in batch:
+                    lines = [(*rng.choice(menu), rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+                    subtotal, tax, total = split_totals(sum(price * quantity for item_id, name, price, quantity in lines))
+                    created_at = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+                    order = Order(
+                        user_id=rng.choice(user_ids), token_number=f'{TOKEN_PREFIX}{n}',
+                        customer_name=f'Customer {n}', customer_phone='555-0100',
+                        payment_method=rng.choice(('cash', 'card', 'online')),
+                        status=rng.choices(statuses, weights)[0],
+                        subtotal=subtotal, tax=tax, total=total,
+                        created_at=created_at, updated_at=created_at,
+                    )
+                    rows.append((order, lines))
+                with transaction.atomic():
+                    Order.objects.bulk_create([order for order, lines in rows])
+                    OrderItem.objects.bulk_create(
+                        OrderItem(order=order, menu_item_id=item_id, menu_item_name=name, quantity=quantity,
+                                  price=price, subtotal=price * quantity)
+                        for order, lines in rows
+                        for item_id, name, price, quantity in lines
+                    )
+                if batch.stop % 100000 == 0 or batch.stop == orders:
+                    log(f'  {batch.stop}/{orders}')
+        log('Rebuilding daily sales summaries')
+        rebuild_daily_sales()
+        log('Counting item popularity')
+        update_recommendations(settle_seconds=0)
+
+
+def summarize(samples, elapsed):
+    """Aggregate ``(seconds, queries, ok)`` samples into a JSON-friendly dict."""
+    latencies = sorted(seconds * 1000 for seconds, queries, ok in samples)
+    queries = sorted(queries for seconds, queries, ok in samples)
+    latency = {f'p{pct}': round(percentile(latencies, pct), 3) for pct in PERCENTILES}
+    latency['mean'] = round(sum(latencies) / len(latencies), 3)
+    latency['max'] = round(latencies[-1], 3)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for seconds, queries, ok in samples if not ok),
+        'requests_per_second': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': latency,
+        'queries': {'median': percentile(queries, 50), 'mean': round(sum(queries) / len(queries), 2), 'max': queries[-1]},
+    }
+
+
+def _request(name, client, rng, category_ids, words):
+    if name == 'menu':
+        params = {'category': rng.choice(category_ids)} if rng.random() < 0.5 else {}
+        return client.get(reverse('menu'), params)
+    if name == 'search':
+        # A typeahead keystroke: the first few letters of a menu word.
+        word = rng.choice(words)
+        return client.get(reverse('api_menu_search'), {'q': word[:rng.randint(2, len(word))]})
+    if name == 'checkout':
+        return client.post(reverse('checkout'), CHECKOUT_DATA)
+    return client.get(reverse(name))
+
+
+def run(scenarios=SCENARIOS, concurrency=8, iterations=50, random_seed=0):
+    """Run each scenario with ``concurrency`` users making ``iterations`` requests each."""
+    users = list(User.objects.filter(username__startswith=USER_PREFIX).order_by('pk')[:concurrency])
+    if len(users) < concurrency:
+        raise ValueError(f'Need at least {concurrency} benchmark users; seed the database first.')
+    staff = User.objects.get(username=STAFF_USERNAME)
+    menu_items = list(MenuItem.objects.filter(is_available=True).order_by('pk')[:100])
+    category_ids = list(Category.objects.values_list('pk', flat=True))
+    words = sorted({word for item in menu_items for word in tokenize(item.name) if len(word) > 1}) or ['menu']
+
+    def simulate(name, index):
+        rng = random.Random(f'{random_seed}-{name}-{index}')
+        user = staff if name == 'analytics' else users[index]
+        samples = []
+        try:
+            client = Client()
+            client.force_login(user)
+            cart, created = Cart.objects.get_or_create(user=user)
+            if name == 'cart' and not cart.item_count:
+                for menu_item in rng.sample(menu_items, min(5, len(menu_items))):
+                    increment_cart_item(cart, menu_item)
+            for _ in range(iterations):
+                start = time.perf_counter()
+                try:
+                    if name == 'checkout':
+                        for menu_item in rng.sample(menu_items, min(3, len(menu_items))):
+                            increment_cart_item(cart, menu_item, rng.randint(1, 2))
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = _request(name, client, rng, category_ids, words)
+                        seconds = time.perf_counter() - start
+                    samples.append((seconds, len(queries), response.status_code < 400))
+                except OperationalError:
+                    # A write that gave up waiting for the database lock.
+                    samples.append((time.perf_counter() - start, 0, False))
+        finally:
+            connection.close()
+        return samples
+
+    results = {}
+    for name in scenarios:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = [s for worker in pool.map(lambda index: simulate(name, index), range(concurrency)) for s in worker]
+        results[name] = summarize(samples, time.perf_counter() - start)
+    return results
+
+
+STARTUP_SCRIPT = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+start = time.perf_counter()
+from django.conf import settings
+database, path = sys.argv[1:3]
+if database:
+    settings.DATABASES['default']['NAME'] = database
+from django.core.servers.basehttp import get_internal_wsgi_application
+application = get_internal_wsgi_application()
+booted = time.perf_counter()
+settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+environ = {'PATH_INFO': path, 'HTTP_HOST': 'testserver'}
+setup_testing_defaults(environ)
+status = []
+response = application(environ, lambda line, headers, exc_info=None: status.append(line))
+b''.join(response)
+response.close()
+done = time.perf_counter()
+print(json.dumps({
+    'boot_ms': (booted - start) * 1000,
+    'first_request_ms': (done - booted) * 1000,
+    'finished': time.time(),
+    'status': int(status[0].split()[0]),
+    'modules': len(sys.modules),
+}))
+'''
+STARTUP_TIMINGS = ('boot_ms', 'first_request_ms', 'time_to_first_request_ms')
+
+
+def startup(runs=5, path='/', database=None, env=None):
+    """Time ``runs`` cold starts, each booting the app and serving one request to ``path``.
+
+    ``env`` adds environment variables for the child processes, such as
+    ``{'SERVING_PROFILE': 'lean'}``. Time to first request is measured from
+    launching the interpreter.
+    """
+    samples = []
+    for _ in range(runs):
+        launched = time.time()
+        process = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, str(database or ''), path],
+            env={**os.environ, **(env or {})}, cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise RuntimeError(f'Startup run failed:\n{process.stderr}')
+        sample = json.loads(process.stdout.strip().splitlines()[-1])
+        sample['time_to_first_request_ms'] = (sample.pop('finished') - launched) * 1000
+        samples.append(sample)
+    result = {'runs': runs, 'status': sorted({sample['status'] for sample in samples}), 'modules': samples[-1]['modules']}
+    for name in STARTUP_TIMINGS:
+        values = sorted(sample[name] for sample in samples)
+        result[name] = {'median': round(percentile(values, 50), 1), 'min': round(values[0], 1), 'max': round(values[-1], 1)}
+    return result
+
+
+def compare(baseline, current, threshold=0.2):
+    """List the scenarios in ``current`` that regressed against ``baseline``.
+
+    A scenario regresses when its p95 latency grows by more than
+    ``threshold`` (a fraction) or it issues more queries per request.
+    """
+    regressions = []
+    for name, result in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        old, new = previous['latency_ms']['p95'], result['latency_ms']['p95']
+        if new > old * (1 + threshold):
+            regressions.append(f'{name}: p95 latency {old}ms -> {new}ms')
+        # The median ignores one-off cache misses and session writes.
+        old, new = previous['queries']['median'], result['queries']['median']
+        if new > old:
+            regressions.append(f'{name}: queries per request {old} -> {new}')
+    return regressions
@@ -0,0 +1,96 @@
+"""
+In-process menu catalog.
+
+Each worker keeps a snapshot of the categories and available menu items,
+tagged with the catalog version it was built for. The current version
+lives in the cache named by ``settings.MENU_CATALOG_CACHE``; writes to
+``Category`` or ``MenuItem`` replace it (see ``signals.py``) and every
+worker rebuilds its snapshot on the next request. Use a shared cache
+backend for that alias when running more than one worker process.
+
+Snapshots are read from the replica (see ``routers.py``) unless the catalog
+changed within the replica lag window.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+
+from .routers import lag_seconds, replica_reads
+
+VERSION_KEY = 'restaurant:menu_catalog_version'
+FEATURED_COUNT = 6
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+class CatalogSnapshot:
+    def __init__(self, version, categories, items, last_modified=None, popular_ids=()):
+        self.version = version
+        self.categories = categories
+        self.items = items
+        self.items_by_id = {item.pk: item for item in items}
+        # Most ordered available items (see recommendations.py), else the first ones.
+        popular = [self.items_by_id[item_id] for item_id in popular_ids if item_id in self.items_by_id]
+        self.featured = (popular or items)[:FEATURED_COUNT]
+        # Latest MenuItem.updated_at, or the version bump if that is newer
+        # (category edits and deletes do not touch updated_at).
+        bumped_at = datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+        self.last_modified = max(last_modified, bumped_at) if last_modified else bumped_at
+        self.items_by_category = {}
+        for item in items:
+            self.items_by_category.setdefault(item.category_id, []).append(item)
+
+    def items_for(self, category_id):
+        try:
+            return self.items_by_category.get(int(category_id), [])
+        except (TypeError, ValueError):
+            return []
+
+
+def _cache():
+    return caches[getattr(settings, 'MENU_CATALOG_CACHE', 'default')]
+
+
+def get_catalog_version():
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        # Evicted or never set: start from a fresh value no old snapshot can match.
+        _cache().add(VERSION_KEY, time.time_ns(), None)
+        version = _cache().get(VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    _cache().set(VERSION_KEY, time.time_ns(), None)
+
+
+def build_catalog(version):
+    from .models import Category, MenuItem
+    from .recommendations import popular_item_ids
+
+    with replica_reads(time.time_ns() - version > lag_seconds() * 1e9):
+        return CatalogSnapshot(
+            version,
+            list(Category.objects.all()),
+            list(MenuItem.objects.filter(is_available=True).select_related('category')),
+            MenuItem.objects.aggregate(last_modified=Max('updated_at'))['last_modified'],
+            # Spares for featured items that have since become unavailable.
+            popular_item_ids(FEATURED_COUNT * 2),
+        )
+
+
+def get_catalog():
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = build_catalog(version)
+    return snapshot
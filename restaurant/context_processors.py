@@ -1,7 +1,12 @@
 from .models import Cart
 
+def request_cart_count(request):
+    """The user's cart item count, looked up at most once per request."""
+    if not hasattr(request, '_cart_count'):
+        request._cart_count = Cart.cached_item_count(request.user) if request.user.is_authenticated else 0
+    return request._cart_count
+
 def cart_count(request):
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        return {'cart_count': cart.item_count}
-    return {'cart_count': 0}
\ No newline at end of file
+    # Resolved only if a template actually renders {{ cart_count }}; the
+    # page's ETag and every use in the template share one lookup.
+    return {'cart_count': lambda: request_cart_count(request)}
@@ -0,0 +1,51 @@
+"""
+Retrying write transactions when SQLite reports the database is busy.
+
+SQLite allows one writer at a time. With the production profile in
+settings (WAL, ``BEGIN IMMEDIATE`` and a busy timeout) a writer normally
+waits for the lock; ``retry_on_busy`` covers what is left: a timeout that
+expires under a burst of checkouts. It only retries outermost
+transactions, since a nested block cannot be re-run on its own.
+"""
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+BUSY_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+def is_busy_error(exc):
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in BUSY_MESSAGES)
+
+
+def retry_on_busy(func=None, *, on_retry=None):
+    """Re-run ``func`` when it fails because the database is busy.
+
+    ``on_retry`` is called with the same arguments before each new attempt,
+    to undo in-memory state left by the rolled-back one. Attempts and the
+    base backoff come from ``settings.DB_BUSY_RETRIES`` and
+    ``settings.DB_BUSY_BACKOFF`` (seconds, doubled after each attempt).
+    """
+    if func is None:
+        return functools.partial(retry_on_busy, on_retry=on_retry)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'DB_BUSY_RETRIES', 3)
+        backoff = getattr(settings, 'DB_BUSY_BACKOFF', 0.05)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt >= retries or connection.in_atomic_block or not is_busy_error(e):
+                    raise
+            attempt += 1
+            # Jitter keeps the retrying writers from colliding again.
+            time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            if on_retry is not None:
+                on_retry(*args, **kwargs)
+    return wrapper
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Order, Category, MenuItem
+from .menu_import import FORMATS as MENU_FORMATS
 
 class RegisterForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -40,4 +41,26 @@ class MenuItemForm(forms.ModelForm):
             'price': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': '0.00'}),
             'image': forms.FileInput(attrs={'class': 'form-control'}),
             'is_available': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        }
\ No newline at end of file
+        }
+
+class MenuImportForm(forms.Form):
+    file = forms.FileField(widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.json'}))
+    withdraw_missing = forms.BooleanField(
+        required=False, widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text='Mark items that are not in the file as unavailable.',
+    )
+    dry_run = forms.BooleanField(
+        required=False, widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text='Show what would change without saving anything.',
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        self.file_format = upload.name.rsplit('.', 1)[-1].lower()
+        if self.file_format not in MENU_FORMATS:
+            raise forms.ValidationError('Upload a .csv or .json file.')
+        try:
+            self.content = upload.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise forms.ValidationError('The file must be UTF-8 text.')
+        return upload
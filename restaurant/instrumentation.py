@@ -0,0 +1,229 @@
+"""
+Per-request query and timing instrumentation.
+
+``InstrumentationMiddleware`` samples a fraction of requests
+(``settings.INSTRUMENTATION_SAMPLE_RATE``) and, for each sampled request,
+records the SQL count, total DB time, repeated identical queries (the
+signature of an N+1 loop) and template render time. The figures are
+aggregated per view name in this process for the staff performance page,
+and go out in a ``Server-Timing`` header only under ``DEBUG`` or to staff,
+since they tell anyone else how the site's queries perform.
+
+Queries are timed by a database execute wrapper installed on every
+connection (see ``signals.py``) and templates by ``TimedDjangoTemplates``;
+both only do work while a sampled request is active, so unsampled requests
+pay for a context variable lookup.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000)
+SAMPLES_PER_VIEW = 1000
+
+_current = ContextVar('restaurant_request_metrics', default=None)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+        self._render_depth = 0
+
+    def duplicates(self, threshold):
+        """SQL statements issued at least ``threshold`` times, most repeated first."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ])
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper: time the query if a sampled request is active."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        # Templates rendered from inside another template (crispy forms,
+        # inclusion tags) are already covered by the outer render.
+        metrics._render_depth += 1
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics._render_depth -= 1
+            if not metrics._render_depth:
+                metrics.render_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time reported to the instrumentation."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.n_plus_one = 0
+        self.durations = deque(maxlen=SAMPLES_PER_VIEW)
+        self.db_times = deque(maxlen=SAMPLES_PER_VIEW)
+        self.render_times = deque(maxlen=SAMPLES_PER_VIEW)
+        self.query_counts = deque(maxlen=SAMPLES_PER_VIEW)
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.duplicate_sql = Counter()
+
+    def add(self, metrics, duplicates):
+        duration_ms = metrics.duration * 1000
+        self.requests += 1
+        self.durations.append(duration_ms)
+        self.db_times.append(metrics.db_time * 1000)
+        self.render_times.append(metrics.render_time * 1000)
+        self.query_counts.append(metrics.queries)
+        bucket = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS_MS) if duration_ms <= bound), -1)
+        self.histogram[bucket] += 1
+        if duplicates:
+            self.n_plus_one += 1
+            for sql, count in duplicates:
+                self.duplicate_sql[sql] = max(self.duplicate_sql[sql], count)
+
+    def summary(self):
+        def percentiles(values):
+            ordered = sorted(values)
+            return {f'p{pct}': percentile(ordered, pct) for pct in (50, 90, 95, 99)}
+        labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}ms']
+        peak = max(self.histogram) or 1
+        return {
+            'requests': self.requests,
+            'n_plus_one': self.n_plus_one,
+            'duration': percentiles(self.durations),
+            'db_time': percentiles(self.db_times),
+            'render_time': percentiles(self.render_times),
+            'queries': percentiles(self.query_counts),
+            'histogram': [
+                {'label': label, 'count': count, 'percent': round(100 * count / peak)}
+                for label, count in zip(labels, self.histogram)
+            ],
+            'duplicate_sql': self.duplicate_sql.most_common(5),
+        }
+
+
+class StatsRegistry:
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view_name, metrics, duplicates):
+        with self._lock:
+            self._views.setdefault(view_name, ViewStats()).add(metrics, duplicates)
+
+    def summary(self):
+        with self._lock:
+            return sorted(
+                ((name, stats.summary()) for name, stats in self._views.items()),
+                key=lambda row: row[1]['duration']['p95'] or 0,
+                reverse=True,
+            )
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = StatsRegistry()
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self.start()
+        if metrics is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        metrics, token = self.start()
+        if metrics is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        user = await request.auser() if hasattr(request, 'auser') else None
+        return self.finish(request, response, metrics, user)
+
+    def start(self):
+        rate = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.05)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None, None
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics)
+
+    def finish(self, request, response, metrics, user):
+        metrics.duration = time.perf_counter() - metrics.start
+        match = request.resolver_match
+        view_name = match.view_name if match else '<unresolved>'
+        threshold = getattr(settings, 'INSTRUMENTATION_DUPLICATE_THRESHOLD', 3)
+        registry.record(view_name, metrics, metrics.duplicates(threshold))
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = metrics.server_timing()
+        return response
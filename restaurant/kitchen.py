@@ -0,0 +1,158 @@
+"""
+Kitchen display push.
+
+``Order.save()`` publishes an event when an order is placed or changes
+status. Events go through the broker named by ``settings.KITCHEN_BROKER``;
+the default ``InProcessBroker`` fans them out to every kitchen screen
+connected to this process via Server-Sent Events. Each screen is an
+``asyncio.Queue`` on the ASGI event loop, not a thread, so hundreds of idle
+connections are cheap. Deployments with several ASGI processes should plug
+in a broker backed by a shared channel (Redis pub/sub, Postgres
+LISTEN/NOTIFY) implementing the same ``publish``/``subscribe`` interface.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .rollups import ACTIVE_STATUSES
+
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+    def __init__(self, broker, loop, maxsize=100):
+        self.broker = broker
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: end the stream so the screen reconnects
+            # and starts again from a fresh snapshot.
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        """Next event, or None on timeout. Raises StopAsyncIteration once closed."""
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register a subscription on the running event loop."""
+        subscription = Subscription(self, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """Send ``event`` to every subscriber. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down.
+                self.unsubscribe(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+_broker = None
+_broker_path = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker, _broker_path
+    path = getattr(settings, 'KITCHEN_BROKER', 'restaurant.kitchen.InProcessBroker')
+    with _broker_lock:
+        if _broker is None or _broker_path != path:
+            _broker = import_string(path)()
+            _broker_path = path
+    return _broker
+
+
+def serialize_order(order, items=None):
+    data = {
+        'id': order.id,
+        'token_number': order.token_number,
+        'customer_name': order.customer_name,
+        'status': order.status,
+        'notes': order.notes,
+        'created_at': order.created_at,
+    }
+    if items is not None:
+        data['items'] = [{'name': item.menu_item_name, 'quantity': item.quantity} for item in items]
+    return data
+
+
+def publish_order_event(order, previous_status=None):
+    """Queue a kitchen event for ``order``, sent once the transaction commits."""
+    def publish():
+        broker = get_broker()
+        if getattr(broker, 'subscriber_count', 1) == 0:
+            return
+        event = {
+            'type': 'order_created' if previous_status is None else 'status_changed',
+            'order': serialize_order(order, order.items.all()),
+        }
+        if previous_status is not None:
+            event['previous_status'] = previous_status
+        broker.publish(event)
+    transaction.on_commit(publish)
+
+
+def format_sse(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def event_stream(subscription, active_orders, heartbeat=HEARTBEAT_SECONDS):
+    """Yield SSE chunks: a snapshot of active orders, then live events."""
+    try:
+        yield format_sse('snapshot', {'orders': active_orders, 'statuses': ACTIVE_STATUSES})
+        while True:
+            try:
+                event = await subscription.get(timeout=heartbeat)
+            except StopAsyncIteration:
+                return
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield format_sse(event['type'], event)
+    finally:
+        subscription.close()
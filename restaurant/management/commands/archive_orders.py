@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.archive import BATCH_SIZE, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move completed and cancelled orders older than the archive age into the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            help='Archive orders older than this many days; defaults to ORDER_ARCHIVE_AFTER_DAYS.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Orders moved per transaction.')
+        parser.add_argument('--limit', type=int, help='Stop after moving this many orders.')
+
+    def handle(self, *args, older_than_days=None, batch_size=BATCH_SIZE, limit=None, **options):
+        moved = archive_orders(older_than_days, batch_size, limit, log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} order(s).'))
@@ -0,0 +1,98 @@
+import json
+import platform
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from restaurant.benchmarks import SCENARIOS, compare, prepare_environment, run, seed, use_sqlite_file
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a separate SQLite database with synthetic data, load-test the ordering '
+        'views with concurrent users and write latency and query-count results to JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=str(settings.BASE_DIR / 'benchmark.sqlite3'),
+                            help='SQLite file to seed and benchmark against; created and migrated if missing.')
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--skip-seed', action='store_true', help='Benchmark the database as it is.')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help='Scenario to run; repeat for several. Defaults to all.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Simulated users per scenario.')
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per simulated user.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and request mix.')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--compare', metavar='BASELINE', help='Previous results file to check for regressions.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 latency growth against the baseline (0.2 = 20%%).')
+
+    def use_database(self, path):
+        try:
+            use_sqlite_file(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+        prepare_environment()
+
+    def handle(self, *args, **options):
+        self.use_database(options['database'])
+        call_command('migrate', verbosity=0, interactive=False)
+
+        if not options['skip_seed']:
+            seed(
+                items=options['items'], users=options['users'], orders=options['orders'],
+                random_seed=options['seed'], log=self.stdout.write,
+            )
+
+        scenarios = options['scenarios'] or SCENARIOS
+        self.stdout.write(f'Running {", ".join(scenarios)} with {options["concurrency"]} users '
+                          f'x {options["iterations"]} requests')
+        try:
+            results = run(scenarios, options['concurrency'], options['iterations'], options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': options['database'],
+                'items': options['items'],
+                'users': options['users'],
+                'orders': options['orders'],
+                'concurrency': options['concurrency'],
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+            },
+            'scenarios': results,
+        }
+        Path(options['output']).write_text(json.dumps(report, indent=2))
+
+        self.stdout.write(f'{"scenario":<12}{"p50":>9}{"p95":>9}{"p99":>9}{"req/s":>9}{"queries":>9}{"errors":>8}')
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{name:<12}{latency["p50"]:>9.1f}{latency["p95"]:>9.1f}{latency["p99"]:>9.1f}'
+                f'{result["requests_per_second"]:>9.1f}{result["queries"]["median"]:>9}{result["errors"]:>8}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read baseline {options["compare"]}: {e}')
+            regressions = compare(baseline, report, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}.')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}.'))
@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.benchmarks import STARTUP_TIMINGS, startup
+
+PROFILES = ('full', 'lean')
+
+
+class Command(BaseCommand):
+    help = (
+        'Boot the WSGI application in fresh processes and time the first request, '
+        'for the full and lean serving profiles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts per profile.')
+        parser.add_argument('--path', default='/', help='URL of the first request.')
+        parser.add_argument('--database', help='SQLite file to serve from; defaults to the configured database.')
+        parser.add_argument('--profile', action='append', choices=PROFILES, dest='profiles',
+                            help='Serving profile to measure; repeat for several. Defaults to both.')
+        parser.add_argument('--output', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, runs=5, path='/', database=None, profiles=None, output=None, **options):
+        results = {}
+        for profile in profiles or PROFILES:
+            try:
+                results[profile] = startup(runs, path, database, env={'SERVING_PROFILE': profile})
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(f'{"profile":<10}{"boot":>10}{"first req":>11}{"to first":>10}{"modules":>9}{"status":>8}')
+        for profile, result in results.items():
+            boot, first, total = (result[name]['median'] for name in STARTUP_TIMINGS)
+            status = ','.join(str(code) for code in result['status'])
+            self.stdout.write(f'{profile:<10}{boot:>10.1f}{first:>11.1f}{total:>10.1f}{result["modules"]:>9}{status:>8}')
+        self.stdout.write('Median milliseconds over each profile\'s runs.')
+        if output:
+            Path(output).write_text(json.dumps({'path': path, 'profiles': results}, indent=2))
+            self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.exports import CHUNK_SIZE, FORMATS, ExportError, export_lines, parse_filters
+from restaurant.rollups import STATUSES
+
+
+class Command(BaseCommand):
+    help = 'Stream orders joined with their items as CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First day to export (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='end', help='Last day to export (YYYY-MM-DD).')
+        parser.add_argument('--status', action='append', dest='statuses', choices=STATUSES,
+                            help='Only orders with this status; repeat for several.')
+        parser.add_argument('--format', dest='export_format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write; defaults to standard output.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, start=None, end=None, statuses=None, export_format='csv', output=None,
+               chunk_size=CHUNK_SIZE, **options):
+        try:
+            start, end, statuses, export_format = parse_filters(start, end, statuses, export_format)
+        except ExportError as e:
+            raise CommandError(str(e))
+        lines = export_lines(export_format, start, end, statuses, chunk_size)
+        if output:
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                f.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f'Exported orders to {output}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.menu_import import FORMATS, MenuImportError, import_menu
+
+
+class Command(BaseCommand):
+    help = 'Create and update categories and menu items from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Menu file to import.')
+        parser.add_argument('--format', dest='file_format', choices=FORMATS,
+                            help='File format; defaults to the file extension.')
+        parser.add_argument('--withdraw-missing', action='store_true',
+                            help='Mark items that are not in the file as unavailable.')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without saving them.')
+
+    def handle(self, path, file_format=None, withdraw_missing=False, dry_run=False, **options):
+        file_format = file_format or path.rsplit('.', 1)[-1].lower()
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                content = f.read()
+        except OSError as e:
+            raise CommandError(str(e))
+        try:
+            plan = import_menu(content, file_format, withdraw_missing, dry_run)
+        except MenuImportError as e:
+            raise CommandError('\n'.join(e.errors))
+        prefix = 'Dry run: ' if dry_run else 'Imported: '
+        self.stdout.write(self.style.SUCCESS(prefix + plan.summary()))
@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.rollups import rebuild_daily_sales
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild the DailySalesSummary rollup from order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=parse_date, help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='end', type=parse_date, help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, start=None, end=None, **options):
+        rows = rebuild_daily_sales(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily sales summaries.'))
@@ -0,0 +1,53 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from restaurant.tasks import purge_finished, run_pending, run_task, schedule_periodic
+
+
+def run_and_close(task_row):
+    try:
+        return run_task(task_row)
+    finally:
+        # Each pool thread has its own connection; don't leave it open between tasks.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (receipt emails and other post-checkout work).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Tasks run at once by this worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Run the tasks that are due now, then exit.')
+        parser.add_argument('--purge-after', type=int, default=7,
+                            help='Delete finished tasks older than this many days; 0 keeps them.')
+
+    def handle(self, *args, threads=4, poll_interval=1.0, once=False, purge_after=7, **options):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Worker {worker_id} running tasks on {threads} thread(s).')
+        last_purge = last_schedule = 0
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='task') as executor:
+            while True:
+                if time.monotonic() - last_schedule > 60:
+                    schedule_periodic()
+                    last_schedule = time.monotonic()
+                if purge_after and time.monotonic() - last_purge > 3600:
+                    purged = purge_finished(timedelta(days=purge_after))
+                    if purged:
+                        self.stdout.write(f'Purged {purged} finished task(s).')
+                    last_purge = time.monotonic()
+                statuses = run_pending(worker_id, limit=threads * 4, executor=executor, runner=run_and_close)
+                for status in set(statuses):
+                    self.stdout.write(f'{statuses.count(status)} task(s) {status}.')
+                if once and not statuses:
+                    break
+                if not statuses:
+                    connections.close_all()
+                    time.sleep(poll_interval)
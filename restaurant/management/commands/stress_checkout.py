@@ -0,0 +1,54 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from restaurant.benchmarks import prepare_environment, run, seed, use_sqlite_file
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer checkout with concurrent users on a scratch SQLite database, once with '
+        "Django's default SQLite settings and once with SQLITE_PRODUCTION_PROFILE, and compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent simulated users.')
+        parser.add_argument('--iterations', type=int, default=25, help='Checkouts per user.')
+        parser.add_argument('--output', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, workers, iterations, output=None, **options):
+        prepare_environment()
+        profiles = {
+            # Django's defaults, without the busy retries either.
+            'default': ({}, {'DB_BUSY_RETRIES': 0}),
+            'production': (settings.SQLITE_PRODUCTION_PROFILE, {}),
+        }
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for label, (profile, overrides) in profiles.items():
+                # A fresh file each time: journal_mode=WAL persists in the file.
+                try:
+                    use_sqlite_file(Path(directory) / f'{label}.sqlite3', profile)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                call_command('migrate', verbosity=0, interactive=False)
+                seed(items=50, users=workers, orders=0, categories=5)
+                self.stdout.write(f'{label}: {workers} users x {iterations} checkouts')
+                with override_settings(**overrides):
+                    results[label] = run(('checkout',), workers, iterations)['checkout']
+
+        self.stdout.write(f'{"profile":<12}{"req/s":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"errors":>8}')
+        for label, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{label:<12}{result["requests_per_second"]:>9.1f}{latency["p50"]:>9.1f}'
+                f'{latency["p95"]:>9.1f}{latency["p99"]:>9.1f}{result["errors"]:>8}'
+            )
+        if output:
+            Path(output).write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from restaurant.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file, the local stand-in for replication.'
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError(f'No "{REPLICA_ALIAS}" database is configured; set DB_REPLICA_PATH.')
+        primary, replica = connections['default'], connections[REPLICA_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite files; use your database\'s replication instead.')
+        primary.ensure_connection()
+        replica.ensure_connection()
+        # The online backup API gives a consistent copy while the site is running.
+        primary.connection.backup(replica.connection)
+        self.stdout.write(self.style.SUCCESS(f'Copied {primary.settings_dict["NAME"]} to {replica.settings_dict["NAME"]}.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.recommendations import update_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Add orders placed since the last run to the item popularity and ordered-together counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle-seconds', type=int,
+                            help='Only count orders at least this old; defaults to RECOMMENDATIONS_SETTLE_SECONDS.')
+
+    def handle(self, *args, settle_seconds=None, **options):
+        counted = update_recommendations(settle_seconds)
+        self.stdout.write(self.style.SUCCESS(f'Counted {counted} new order(s).'))
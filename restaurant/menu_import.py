@@ -0,0 +1,224 @@
+"""
+Bulk menu import.
+
+``parse_menu()`` reads a CSV or JSON menu file into plain rows,
+``plan_import()`` diffs them against the current ``Category`` and
+``MenuItem`` tables in one pass, and ``apply_import()`` writes the
+difference with ``bulk_create``/``bulk_update`` in a single transaction.
+Bulk writes skip model signals, so the catalog is invalidated once on
+commit and the carts holding repriced items are recomputed in one query.
+
+Items are matched on (category name, item name). CSV files have the
+columns ``category, name, description, price, is_available`` and
+optionally ``category_description``. JSON files hold either a list of
+such objects or ``{"categories": [{"name", "description"}], "items": [...]}``.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import invalidate_catalog
+from .db import retry_on_busy
+from .models import Cart, Category, MenuItem
+
+FORMATS = ('csv', 'json')
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+ITEM_FIELDS = ['description', 'price', 'is_available']
+
+
+class MenuImportError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+@dataclass
+class ImportPlan:
+    new_categories: list = field(default_factory=list)
+    changed_categories: list = field(default_factory=list)
+    new_items: list = field(default_factory=list)
+    changed_items: list = field(default_factory=list)
+    repriced_items: list = field(default_factory=list)
+    withdrawn_items: list = field(default_factory=list)
+    unchanged_items: int = 0
+
+    @property
+    def has_changes(self):
+        return any([self.new_categories, self.changed_categories, self.new_items, self.changed_items, self.withdrawn_items])
+
+    def summary(self):
+        return (
+            f'{len(self.new_categories)} new and {len(self.changed_categories)} updated categories; '
+            f'{len(self.new_items)} new, {len(self.changed_items)} updated '
+            f'({len(self.repriced_items)} repriced), {len(self.withdrawn_items)} withdrawn '
+            f'and {self.unchanged_items} unchanged items'
+        )
+
+
+def _parse_bool(value, default=True):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f'"{value}" is not yes/no')
+
+
+def _clean_row(raw, label, errors):
+    category = str(raw.get('category') or '').strip()
+    name = str(raw.get('name') or '').strip()
+    if not category or not name:
+        errors.append(f'{label}: category and name are required.')
+        return None
+    try:
+        price = Decimal(str(raw.get('price', '')).strip())
+        if price < Decimal('0.01'):
+            raise InvalidOperation
+    except InvalidOperation:
+        errors.append(f'{label}: invalid price "{raw.get("price")}".')
+        return None
+    try:
+        is_available = _parse_bool(raw.get('is_available'))
+    except ValueError as e:
+        errors.append(f'{label}: is_available {e}.')
+        return None
+    return {
+        'category': category,
+        'category_description': str(raw.get('category_description') or '').strip(),
+        'name': name,
+        'description': str(raw.get('description') or '').strip(),
+        'price': price.quantize(Decimal('0.01')),
+        'is_available': is_available,
+    }
+
+
+def parse_menu(content, file_format):
+    """Parse menu ``content`` (text) into ``(categories, items)``.
+
+    ``categories`` maps category names to descriptions (None where the file
+    gives none); ``items`` is a list of cleaned row dicts. Raises
+    MenuImportError listing every bad row.
+    """
+    if file_format not in FORMATS:
+        raise MenuImportError([f'Unknown format "{file_format}". Choose from {", ".join(FORMATS)}.'])
+    categories = {}
+    if file_format == 'csv':
+        raw_rows = [(f'Row {n}', row) for n, row in enumerate(csv.DictReader(io.StringIO(content)), start=2)]
+    else:
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            raise MenuImportError([f'Invalid JSON: {e}'])
+        if isinstance(data, dict):
+            for category in data.get('categories', []):
+                if isinstance(category, dict) and category.get('name'):
+                    categories[str(category['name']).strip()] = str(category.get('description') or '').strip()
+            data = data.get('items', [])
+        if not isinstance(data, list):
+            raise MenuImportError(['Expected a list of items.'])
+        raw_rows = [(f'Item {n}', row if isinstance(row, dict) else {}) for n, row in enumerate(data, start=1)]
+
+    errors, items, seen = [], [], set()
+    for label, raw in raw_rows:
+        row = _clean_row(raw, label, errors)
+        if row is None:
+            continue
+        key = (row['category'], row['name'])
+        if key in seen:
+            errors.append(f'{label}: "{row["name"]}" appears more than once in "{row["category"]}".')
+            continue
+        seen.add(key)
+        items.append(row)
+        if row['category_description'] or row['category'] not in categories:
+            categories[row['category']] = row['category_description'] or categories.get(row['category'])
+    if errors:
+        raise MenuImportError(errors)
+    return categories, items
+
+
+def plan_import(categories, items, withdraw_missing=False):
+    """Diff parsed rows against the database. Reads each table once."""
+    plan = ImportPlan()
+    existing_categories = {}
+    for category in Category.objects.order_by('pk'):
+        existing_categories.setdefault(category.name, category)
+    for name, description in categories.items():
+        category = existing_categories.get(name)
+        if category is None:
+            category = Category(name=name, description=description or '')
+            plan.new_categories.append(category)
+            existing_categories[name] = category
+        elif description and category.description != description:
+            category.description = description
+            plan.changed_categories.append(category)
+
+    existing_items = {}
+    for item in MenuItem.objects.select_related('category').order_by('pk'):
+        existing_items.setdefault((item.category.name, item.name), item)
+    imported = set()
+    for row in items:
+        key = (row['category'], row['name'])
+        imported.add(key)
+        item = existing_items.get(key)
+        values = {name: row[name] for name in ITEM_FIELDS}
+        if item is None:
+            plan.new_items.append(MenuItem(category=existing_categories[row['category']], name=row['name'], **values))
+        elif any(getattr(item, name) != value for name, value in values.items()):
+            if item.price != row['price']:
+                plan.repriced_items.append(item)
+            for name, value in values.items():
+                setattr(item, name, value)
+            plan.changed_items.append(item)
+        else:
+            plan.unchanged_items += 1
+
+    if withdraw_missing:
+        for key, item in existing_items.items():
+            if key not in imported and item.is_available:
+                item.is_available = False
+                plan.withdrawn_items.append(item)
+    return plan
+
+
+def _discard_attempt(plan):
+    for obj in plan.new_categories + plan.new_items:
+        obj.pk = None
+        obj._state.adding = True
+
+
+@retry_on_busy(on_retry=_discard_attempt)
+def apply_import(plan):
+    """Write ``plan`` in one transaction; returns the plan."""
+    if not plan.has_changes:
+        return plan
+    now = timezone.now()
+    with transaction.atomic():
+        Category.objects.bulk_create(plan.new_categories)
+        Category.objects.bulk_update(plan.changed_categories, ['description'])
+        MenuItem.objects.bulk_create(plan.new_items)
+        updated = plan.changed_items + plan.withdrawn_items
+        for item in updated:
+            # bulk_update() does not apply auto_now, and the catalog's
+            # Last-Modified relies on it.
+            item.updated_at = now
+        MenuItem.objects.bulk_update(updated, ITEM_FIELDS + ['updated_at'], batch_size=500)
+        if plan.repriced_items:
+            Cart.refresh_totals(Cart.objects.filter(items__menu_item__in=plan.repriced_items).distinct())
+        transaction.on_commit(invalidate_catalog)
+    return plan
+
+
+def import_menu(content, file_format, withdraw_missing=False, dry_run=False):
+    """Parse, diff and (unless ``dry_run``) apply a menu file; returns the plan."""
+    plan = plan_import(*parse_menu(content, file_format), withdraw_missing=withdraw_missing)
+    return plan if dry_run else apply_import(plan)
@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+def seed_global_sequence(apps, schema_editor):
+    Order = apps.get_model('restaurant', 'Order')
+    TokenSequence = apps.get_model('restaurant', 'TokenSequence')
+    last_value = 1000
+    for token in Order.objects.values_list('token_number', flat=True).iterator():
+        number = token.lstrip('#')
+        if number.isdigit():
+            last_value = max(last_value, int(number))
+    TokenSequence.objects.update_or_create(key='global', defaults={'last_value': last_value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0002_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=20, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='token_number',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+        migrations.RunPython(seed_global_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 04:17
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('restaurant', 'Cart')
+    for cart in Cart.objects.prefetch_related('items__menu_item'):
+        lines = cart.items.all()
+        cart.total = sum((line.menu_item.price * line.quantity for line in lines), Decimal('0'))
+        cart.item_count = sum(line.quantity for line in lines)
+        cart.save(update_fields=['total', 'item_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0003_token_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=10),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 04:21
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    Order = apps.get_model('restaurant', 'Order')
+    DailySalesSummary = apps.get_model('restaurant', 'DailySalesSummary')
+    statuses = ['completed', 'pending', 'preparing', 'ready', 'cancelled']
+    rows = (
+        Order.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(
+            revenue=Sum('total', filter=Q(status='completed'), default=Decimal('0')),
+            order_count=Count('id'),
+            **{f'{status}_count': Count('id', filter=Q(status=status)) for status in statuses}
+        )
+    )
+    DailySalesSummary.objects.bulk_create(DailySalesSummary(date=row.pop('day'), **row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0004_cart_running_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('order_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('preparing_count', models.IntegerField(default=0)),
+                ('ready_count', models.IntegerField(default=0)),
+                ('cancelled_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales summaries',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 05:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def backfill_order_item_keys(apps, schema_editor):
+    # Names that belong to exactly one menu item can be linked unambiguously.
+    MenuItem = apps.get_model('restaurant', 'MenuItem')
+    OrderItem = apps.get_model('restaurant', 'OrderItem')
+    unique_names = (
+        MenuItem.objects.order_by().values('name')
+        .annotate(items=Count('id'), item_id=Min('id'))
+        .filter(items=1)
+    )
+    for row in unique_names:
+        OrderItem.objects.filter(menu_item_name=row['name'], menu_item__isnull=True).update(menu_item_id=row['item_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='menu_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='restaurant.menuitem'),
+        ),
+        migrations.CreateModel(
+            name='ItemStats',
+            fields=[
+                ('menu_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='restaurant.menuitem')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('together', models.JSONField(default=dict)),
+                ('recommended', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Item stats',
+                'indexes': [models.Index(fields=['-order_count'], name='itemstats_popularity_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_order_item_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 09:40
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.db import migrations
+from django.utils import timezone
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+CACHED_BACKEND = 'restaurant.auth.CachedModelBackend'
+BATCH_SIZE = 500
+
+
+def move_sessions(apps, old, new):
+    Session = apps.get_model('sessions', 'Session')
+    store = SessionStore()
+    moved = []
+
+    def flush():
+        Session.objects.bulk_update(moved, ['session_data'])
+        if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db':
+            # Drop the cached copies so the next read loads the rewritten row.
+            caches[settings.SESSION_CACHE_ALIAS].delete_many([KEY_PREFIX + s.session_key for s in moved])
+        moved.clear()
+
+    for session in Session.objects.filter(expire_date__gt=timezone.now()).iterator():
+        data = store.decode(session.session_data)
+        if data.get(BACKEND_SESSION_KEY) != old:
+            continue
+        data[BACKEND_SESSION_KEY] = new
+        session.session_data = store.encode(data)
+        moved.append(session)
+        if len(moved) >= BATCH_SIZE:
+            flush()
+    if moved:
+        flush()
+
+
+def forwards(apps, schema_editor):
+    move_sessions(apps, MODEL_BACKEND, CACHED_BACKEND)
+
+
+def backwards(apps, schema_editor):
+    move_sessions(apps, CACHED_BACKEND, MODEL_BACKEND)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0009_order_archive'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -1,7 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
+from .kitchen import publish_order_event
+from .rollups import record_order, record_order_change
+from .tokens import next_token_number
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -30,22 +38,94 @@ class MenuItem(models.Model):
     
     def __str__(self):
         return f"{self.name} - ${self.price}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        price_changed = not self._state.adding and getattr(self, '_loaded_price', None) != self.price
+        super().save(*args, **kwargs)
+        self._loaded_price = self.price
+        if price_changed:
+            Cart.refresh_totals(Cart.objects.filter(items__menu_item=self))
 
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Running totals, kept up to date by the cart views so reads are free.
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0'))
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Cart for {self.user.username}"
     
-    @property
-    def total(self):
-        return sum(item.subtotal for item in self.items.all())
+    def adjust_totals(self, quantity, price):
+        """Shift the running totals by ``quantity`` units at ``price`` (negative to remove)."""
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=F('item_count') + quantity,
+            total=F('total') + quantity * price,
+            updated_at=timezone.now(),
+        )
+        Cart.forget_item_count(self.user_id)
     
-    @property
-    def item_count(self):
-        return sum(item.quantity for item in self.items.all())
+    def clear(self):
+        self.items.all().delete()
+        Cart.objects.filter(pk=self.pk).update(total=Decimal('0'), item_count=0, updated_at=timezone.now())
+        self.total = Decimal('0')
+        self.item_count = 0
+        Cart.forget_item_count(self.user_id)
+    
+    def remove_lines(self, lines):
+        """Delete ``lines`` only, so lines added meanwhile stay, and recompute the totals."""
+        CartItem.objects.filter(pk__in=[line.pk for line in lines]).delete()
+        self.recalculate()
+    
+    def recalculate(self):
+        Cart.refresh_totals(Cart.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=['total', 'item_count'])
+    
+    @staticmethod
+    def refresh_totals(carts):
+        """Recompute the running totals of every cart in ``carts`` from its lines."""
+        user_ids = list(carts.values_list('user_id', flat=True))
+        lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        carts.update(
+            total=Coalesce(
+                Subquery(lines.annotate(
+                    amount=Sum(F('quantity') * F('menu_item__price'), output_field=models.DecimalField(max_digits=10, decimal_places=2))
+                ).values('amount')),
+                Decimal('0'),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+            item_count=Coalesce(Subquery(lines.annotate(count=Sum('quantity')).values('count')), 0),
+        )
+        Cart.forget_item_count(*user_ids)
+    
+    @staticmethod
+    def cached_item_count(user):
+        """The navbar badge count, served from a per-user cache entry.
+        
+        Never creates a cart; users without one get 0.
+        """
+        cache = caches[settings.CART_COUNT_CACHE]
+        key = f'restaurant:cart_count:{user.pk}'
+        count = cache.get(key)
+        if count is None:
+            count = Cart.objects.filter(user=user).values_list('item_count', flat=True).first() or 0
+            cache.set(key, count)
+        return count
+    
+    @staticmethod
+    def forget_item_count(*user_ids):
+        def forget():
+            caches[settings.CART_COUNT_CACHE].delete_many([f'restaurant:cart_count:{pk}' for pk in user_ids])
+        # Again after commit, so a concurrent read cannot re-cache the old count.
+        forget()
+        transaction.on_commit(forget)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -79,7 +159,7 @@ class Order(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    token_number = models.CharField(max_length=10, unique=True, editable=False)
+    token_number = models.CharField(max_length=20, unique=True, editable=False)
     customer_name = models.CharField(max_length=200)
     customer_phone = models.CharField(max_length=20)
     customer_email = models.EmailField(blank=True)
@@ -94,26 +174,178 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # orders_view: a user's history, newest first
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            # analytics and active-order lookups: status (or status IN ...) plus a created_at range
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # analytics: today's live figures across all statuses
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.token_number} - {self.customer_name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_total = instance.__dict__.get('total')
+        return instance
+    
     def save(self, *args, **kwargs):
         if not self.token_number:
-            last_order = Order.objects.order_by('-id').first()
-            if last_order and last_order.token_number:
-                last_number = int(last_order.token_number[1:])
-                self.token_number = f"#{last_number + 1}"
-            else:
-                self.token_number = "#1001"
+            self.token_number = next_token_number()
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if adding:
+            record_order(self)
+            publish_order_event(self)
+        else:
+            loaded_status = getattr(self, '_loaded_status', None)
+            loaded_total = getattr(self, '_loaded_total', None)
+            if (loaded_status, loaded_total) != (self.status, self.total):
+                record_order_change(self, loaded_status, loaded_total)
+            if loaded_status != self.status:
+                publish_order_event(self, loaded_status or '')
+        self._loaded_status = self.status
+        self._loaded_total = self.total
+
+class TokenSequence(models.Model):
+    key = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.key}: {self.last_value}"
+
+class DailySalesSummary(models.Model):
+    date = models.DateField(unique=True)
+    # Revenue counts completed orders only, like the analytics dashboard.
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    order_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    preparing_count = models.IntegerField(default=0)
+    ready_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Daily sales summaries"
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"Sales for {self.date}"
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # The name is kept as ordered; the key survives renames and is cleared if the item is deleted.
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
     menu_item_name = models.CharField(max_length=200)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     
     def __str__(self):
-        return f"{self.quantity}x {self.menu_item_name}"
\ No newline at end of file
+        return f"{self.quantity}x {self.menu_item_name}"
+
+class ArchivedOrder(models.Model):
+    """A closed order moved out of ``Order`` by archive.py, keeping its id and token."""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    token_number = models.CharField(max_length=20, unique=True)
+    customer_name = models.CharField(max_length=200)
+    customer_phone = models.CharField(max_length=20)
+    customer_email = models.EmailField(blank=True)
+    notes = models.TextField(blank=True)
+    payment_method = models.CharField(max_length=20, choices=Order.PAYMENT_CHOICES)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    tax = models.DecimalField(max_digits=10, decimal_places=2)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_order_user_idx'),
+            models.Index(fields=['created_at'], name='archived_order_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived order {self.token_number} - {self.customer_name}"
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    menu_item_name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.menu_item_name}"
+
+class ItemStats(models.Model):
+    """Precomputed popularity and "ordered together" counts (see recommendations.py)."""
+    menu_item = models.OneToOneField(MenuItem, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    order_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    # {other menu item id: number of orders containing both}
+    together = models.JSONField(default=dict)
+    # Other menu item ids, most often ordered together first.
+    recommended = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Item stats"
+        indexes = [
+            # featured items: most ordered first
+            models.Index(fields=['-order_count'], name='itemstats_popularity_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Stats for item {self.menu_item_id}"
+
+class JobCursor(models.Model):
+    """How far an incremental job has read, e.g. the last order it counted."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+class Task(models.Model):
+    """A unit of background work, run by the ``run_tasks`` worker (see tasks.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['run_at', 'pk']
+        indexes = [
+            # the worker's poll: due tasks in a status, oldest first
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
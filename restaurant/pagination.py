@@ -0,0 +1,41 @@
+"""
+Keyset (cursor) pagination on ``(created_at, id)``.
+
+The cursor is the position of the last row of the previous page, so each
+page is a single indexed range query however deep the history goes.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(obj):
+    micros = (obj.created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{obj.pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split('-')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, per_page=20):
+    """Return ``(rows, next_cursor)`` for rows ordered newest first.
+
+    ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by('-created_at', '-pk')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(queryset[:per_page + 1])
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
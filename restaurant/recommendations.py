@@ -0,0 +1,147 @@
+"""
+Featured items and "frequently ordered together" lists from order history.
+
+``update_recommendations()`` reads the orders placed since its last run
+(tracked by a ``JobCursor``) and adds them to ``ItemStats``: per menu item,
+how many orders contained it and how often each other item was in the
+same order. Only the items touched by those orders are rewritten, each with
+its ``recommended`` list re-ranked. It runs periodically on the task
+worker (every ``settings.RECOMMENDATIONS_INTERVAL`` seconds) or from the
+``update_recommendations`` command.
+
+Requests never aggregate history: the catalog snapshot carries the most
+ordered items for ``home``, and ``cart_view`` reads the lists of the items
+in the cart with one primary-key lookup.
+
+Orders are counted once they are ``settings.RECOMMENDATIONS_SETTLE_SECONDS``
+old, so a transaction that committed after a later order id was read is
+not skipped. Cancelled orders are left out; cancelling an order after it
+was counted does not take it back out.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import FEATURED_COUNT, invalidate_catalog
+from .db import retry_on_busy
+from .tasks import task
+
+CURSOR_NAME = 'recommendations'
+RECOMMENDED_PER_ITEM = 10
+BATCH_SIZE = 2000
+
+
+def popular_item_ids(limit):
+    from .models import ItemStats
+
+    return list(
+        ItemStats.objects.filter(order_count__gt=0)
+        .order_by('-order_count', 'menu_item_id')
+        .values_list('menu_item_id', flat=True)[:limit]
+    )
+
+
+def _rank(together):
+    ranked = sorted(together.items(), key=lambda entry: (-entry[1], int(entry[0])))
+    return [int(item_id) for item_id, count in ranked[:RECOMMENDED_PER_ITEM]]
+
+
+def _count_batch(cursor, batch_size, cutoff):
+    from .models import ItemStats, Order, OrderItem
+
+    orders = Order.objects.filter(pk__gt=cursor.position).order_by('pk').values_list('pk', 'created_at')
+    order_ids = []
+    for order_id, created_at in orders[:batch_size]:
+        if created_at >= cutoff:
+            # Stop at the first unsettled order rather than skip past it.
+            break
+        order_ids.append(order_id)
+    if not order_ids:
+        return 0
+    lines = (
+        OrderItem.objects.filter(order_id__gt=cursor.position, order_id__lte=order_ids[-1], menu_item__isnull=False)
+        .exclude(order__status='cancelled')
+        .values_list('order_id', 'menu_item_id', 'quantity')
+    )
+    baskets = defaultdict(Counter)
+    for order_id, item_id, quantity in lines:
+        baskets[order_id][item_id] += quantity
+
+    order_counts, quantities, together = Counter(), Counter(), defaultdict(Counter)
+    for items in baskets.values():
+        for item_id, quantity in items.items():
+            order_counts[item_id] += 1
+            quantities[item_id] += quantity
+            for other_id in items:
+                if other_id != item_id:
+                    together[item_id][str(other_id)] += 1
+
+    stats = ItemStats.objects.in_bulk(list(order_counts))
+    new = []
+    for item_id in order_counts:
+        row = stats.get(item_id)
+        if row is None:
+            row = ItemStats(menu_item_id=item_id)
+            new.append(row)
+        row.order_count += order_counts[item_id]
+        row.quantity += quantities[item_id]
+        row.together = dict(Counter(row.together) + together[item_id])
+        row.recommended = _rank(row.together)
+        row.updated_at = timezone.now()
+    ItemStats.objects.bulk_create(new)
+    ItemStats.objects.bulk_update(
+        [row for row in stats.values()], ['order_count', 'quantity', 'together', 'recommended', 'updated_at'],
+        batch_size=500,
+    )
+    cursor.position = order_ids[-1]
+    cursor.save(update_fields=['position', 'updated_at'])
+    return len(order_ids)
+
+
+@retry_on_busy
+def update_recommendations(settle_seconds=None, batch_size=BATCH_SIZE):
+    """Count the orders placed since the last run; returns how many were read."""
+    from .models import JobCursor
+
+    if settle_seconds is None:
+        settle_seconds = getattr(settings, 'RECOMMENDATIONS_SETTLE_SECONDS', 60)
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    featured = popular_item_ids(FEATURED_COUNT * 2)
+    total = 0
+    while True:
+        # One transaction per batch keeps the write lock short.
+        with transaction.atomic():
+            cursor, created = JobCursor.objects.get_or_create(name=CURSOR_NAME)
+            counted = _count_batch(cursor, batch_size, cutoff)
+        if not counted:
+            break
+        total += counted
+    if total and popular_item_ids(FEATURED_COUNT * 2) != featured:
+        # The catalog snapshot carries the featured list; rebuild it.
+        invalidate_catalog()
+    return total
+
+
+@task(every=lambda: getattr(settings, 'RECOMMENDATIONS_INTERVAL', 300))
+def refresh_recommendations():
+    update_recommendations()
+
+
+def recommendations_for(item_ids, catalog, limit=4):
+    """Available items most often ordered with ``item_ids``, best first. One query."""
+    from .models import ItemStats
+
+    item_ids = set(item_ids)
+    if not item_ids:
+        return []
+    scores = Counter()
+    for recommended in ItemStats.objects.filter(pk__in=item_ids).values_list('recommended', flat=True):
+        for rank, other_id in enumerate(recommended):
+            if other_id not in item_ids:
+                scores[other_id] += 1 / (rank + 1)
+    ranked = sorted(scores, key=lambda item_id: (-scores[item_id], item_id))
+    items = [catalog.items_by_id[item_id] for item_id in ranked if item_id in catalog.items_by_id]
+    return items[:limit]
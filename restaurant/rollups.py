@@ -0,0 +1,154 @@
+"""
+Daily sales rollups.
+
+``DailySalesSummary`` holds one row per day with completed revenue, the
+order count and a count per status. ``Order.save()`` keeps the row for the
+order's day up to date; ``rebuild_daily_sales()`` (and the
+``rebuild_sales_summary`` management command) recomputes it from history,
+including the orders moved to the archive (archive.py).
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+ACTIVE_STATUSES = ['pending', 'preparing', 'ready']
+STATUSES = ['completed', 'pending', 'preparing', 'ready', 'cancelled']
+
+
+def day_range(start_date, end_date=None):
+    """Aware datetime bounds covering ``start_date`` up to (not including) ``end_date``."""
+    if end_date is None:
+        end_date = start_date + timedelta(days=1)
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min), tz),
+        timezone.make_aware(datetime.combine(end_date, time.min), tz),
+    )
+
+
+def _order_date(order):
+    return timezone.localdate(order.created_at)
+
+
+def _revenue(status, total):
+    return total if status == 'completed' else Decimal('0')
+
+
+def _apply(date, changes):
+    from .models import DailySalesSummary
+
+    while True:
+        try:
+            with transaction.atomic():
+                updated = DailySalesSummary.objects.filter(date=date).update(
+                    updated_at=timezone.now(),
+                    **{field: F(field) + value for field, value in changes.items()}
+                )
+                if not updated:
+                    DailySalesSummary.objects.create(date=date, **changes)
+            return
+        except IntegrityError:
+            continue
+
+
+def record_order(order, sign=1):
+    changes = {
+        'order_count': sign,
+        'revenue': sign * _revenue(order.status, order.total),
+    }
+    changes[f'{order.status}_count'] = sign
+    _apply(_order_date(order), changes)
+
+
+def record_order_change(order, old_status, old_total):
+    if old_status is None or old_total is None:
+        # The previous values were not loaded; recount the whole day.
+        rebuild_daily_sales(_order_date(order), _order_date(order))
+        return
+    changes = {'revenue': _revenue(order.status, order.total) - _revenue(old_status, old_total)}
+    if old_status != order.status:
+        changes[f'{old_status}_count'] = -1
+        changes[f'{order.status}_count'] = 1
+    _apply(_order_date(order), changes)
+
+
+def rebuild_daily_sales(start_date=None, end_date=None):
+    """Recompute the rollup rows between ``start_date`` and ``end_date`` (inclusive).
+
+    Without bounds the whole order history is rebuilt. Returns the number of
+    rows written.
+    """
+    from .models import ArchivedOrder, DailySalesSummary, Order
+
+    summaries = DailySalesSummary.objects.all()
+    if start_date:
+        summaries = summaries.filter(date__gte=start_date)
+    if end_date:
+        summaries = summaries.filter(date__lte=end_date)
+
+    counts = {f'{status}_count': Count('id', filter=Q(status=status)) for status in STATUSES}
+    days = {}
+    for model in (Order, ArchivedOrder):
+        orders = model.objects.order_by()
+        if start_date:
+            orders = orders.filter(created_at__gte=day_range(start_date)[0])
+        if end_date:
+            orders = orders.filter(created_at__lt=day_range(end_date)[1])
+        rows = (
+            orders.annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(
+                revenue=Sum('total', filter=Q(status='completed'), default=Decimal('0')),
+                order_count=Count('id'),
+                **counts
+            )
+        )
+        for row in rows.iterator():
+            day = row.pop('day')
+            if day in days:
+                # An archive run can leave one day split across both tables.
+                days[day] = {field: days[day][field] + value for field, value in row.items()}
+            else:
+                days[day] = row
+    with transaction.atomic():
+        summaries.delete()
+        created = DailySalesSummary.objects.bulk_create(
+            DailySalesSummary(date=day, **days[day]) for day in sorted(days)
+        )
+    return len(created)
+
+
+def sales_overview(today=None):
+    """Dashboard figures from the rollup for past days plus a live query for today."""
+    from .models import DailySalesSummary, Order
+
+    today = today or timezone.localdate()
+    week_ago = today - timedelta(days=7)
+    month_start = today.replace(day=1)
+    zero = Decimal('0')
+
+    past = DailySalesSummary.objects.filter(date__lt=today).aggregate(
+        weekly_revenue=Sum('revenue', filter=Q(date__gte=week_ago), default=zero),
+        monthly_revenue=Sum('revenue', filter=Q(date__gte=month_start), default=zero),
+        total_revenue=Sum('revenue', default=zero),
+        total_orders=Sum('completed_count', default=0),
+        pending_orders=Sum(F('pending_count') + F('preparing_count') + F('ready_count'), default=0),
+    )
+    start, end = day_range(today)
+    live = Order.objects.filter(created_at__gte=start, created_at__lt=end).aggregate(
+        revenue=Sum('total', filter=Q(status='completed'), default=zero),
+        completed=Count('id', filter=Q(status='completed')),
+        pending=Count('id', filter=Q(status__in=ACTIVE_STATUSES)),
+    )
+    return {
+        'daily_revenue': live['revenue'],
+        'weekly_revenue': past['weekly_revenue'] + live['revenue'],
+        'monthly_revenue': past['monthly_revenue'] + live['revenue'],
+        'total_orders': past['total_orders'] + live['completed'],
+        'pending_orders': past['pending_orders'] + live['pending'],
+        'total_revenue': past['total_revenue'] + live['revenue'],
+    }
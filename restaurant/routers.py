@@ -0,0 +1,120 @@
+"""
+Read-replica routing for reporting queries.
+
+When ``settings.DATABASES`` has a ``replica`` alias, code running inside
+``replica_reads()`` (or a view decorated with it) reads from the replica;
+everything else, and every write, uses ``default``. The analytics
+dashboard, order history and the menu catalog rebuild opt in.
+
+Replicas lag. After a client makes a write request,
+``ReplicaPinningMiddleware`` pins it to the primary for
+``settings.REPLICA_LAG_SECONDS`` with a cookie, so the receipt and order
+history right after checkout always show the new order. The catalog is
+likewise rebuilt from the primary while its last change is that recent.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'primary_until'
+
+_replica_reads = ContextVar('restaurant_replica_reads', default=False)
+_pinned = ContextVar('restaurant_pinned_to_primary', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def lag_seconds():
+    return getattr(settings, 'REPLICA_LAG_SECONDS', 5)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads inside the block to the replica, unless pinned to the primary."""
+    token = _replica_reads.set(enabled and not _pinned.get())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view):
+    """View decorator: run the view's reads against the replica.
+
+    Put it below ``login_required`` so the session and user are loaded
+    from the primary first.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with replica_reads():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with replica_reads():
+                return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _pinned.set(self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(self.is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.pin_after_write(request, response)
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def pin_after_write(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and replica_configured():
+            lag = lag_seconds()
+            response.set_cookie(PIN_COOKIE, f'{time.time() + lag:.3f}', max_age=lag, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,164 @@
+"""
+Typeahead search over the menu catalog.
+
+``SearchIndex`` is an in-process inverted index from word to the available
+menu items containing it, weighted by field (name over category over
+description). Every query word matches as a prefix, so "chi bur" finds
+"Chicken Burger"; items must match all words and are ranked by the summed
+field weights, with exact words and names starting with the query first.
+Prefixes are looked up by bisecting a sorted vocabulary, so a query costs
+a few dictionary reads rather than a scan of the menu.
+
+The index follows the catalog (catalog.py). When the catalog version
+changes, ``get_search_index()`` diffs the new snapshot against what it has
+indexed and re-tokenizes only the items that were added, edited (their
+``updated_at`` or category name changed) or removed.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from .catalog import get_catalog
+
+FIELD_WEIGHTS = {'name': 3.0, 'category': 1.5, 'description': 1.0}
+# A prefix match of an unfinished word counts for less than the whole word.
+PREFIX_FACTOR = 0.6
+NAME_PREFIX_BONUS = 2.0
+MAX_PREFIX_EXPANSION = 200
+MAX_RESULTS = 50
+
+_word = re.compile(r'\w+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text):
+    return _word.findall(normalize(text))
+
+
+def _fields(item):
+    return {'name': item.name, 'category': item.category.name, 'description': item.description}
+
+
+def _signature(item):
+    return item.updated_at, item.category.name
+
+
+class SearchIndex:
+    def __init__(self):
+        self.version = None
+        self.items = {}
+        self.signatures = {}
+        self.postings = {}
+        self.vocabulary = []
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def add(self, item):
+        weights = {}
+        for field, text in _fields(item).items():
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0), FIELD_WEIGHTS[field])
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self.vocabulary.insert(bisect_left(self.vocabulary, token), token)
+            posting[item.pk] = weight
+        self.items[item.pk] = item
+        self.signatures[item.pk] = _signature(item)
+        self.names[item.pk] = normalize(item.name)
+
+    def remove(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return
+        del self.signatures[item_id], self.names[item_id]
+        for token in {token for text in _fields(item).values() for token in tokenize(text)}:
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(item_id, None)
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def sync(self, catalog):
+        """Bring the index up to ``catalog``, touching only changed items."""
+        current = {item.pk: item for item in catalog.items}
+        changed = 0
+        for item_id in [item_id for item_id in self.items if item_id not in current]:
+            self.remove(item_id)
+            changed += 1
+        for item_id, item in current.items():
+            if self.signatures.get(item_id) != _signature(item):
+                self.remove(item_id)
+                self.add(item)
+                changed += 1
+            else:
+                # Same content; keep the snapshot's instance for rendering.
+                self.items[item_id] = item
+        self.version = catalog.version
+        return changed
+
+    def _expand(self, term):
+        start = bisect_left(self.vocabulary, term)
+        tokens = []
+        for token in self.vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, query, limit=10):
+        """Items matching every word of ``query`` as a prefix, best first; ``limit=None`` returns all."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token in self._expand(term):
+                    factor = 1.0 if token == term else PREFIX_FACTOR
+                    for item_id, weight in self.postings[token].items():
+                        term_scores[item_id] = max(term_scores.get(item_id, 0), weight * factor)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {item_id: score + term_scores[item_id] for item_id, score in scores.items() if item_id in term_scores}
+                if not scores:
+                    return []
+            phrase = ' '.join(terms)
+
+            def rank(entry):
+                item_id, score = entry
+                bonus = NAME_PREFIX_BONUS if self.names[item_id].startswith(phrase) else 0
+                return -(score + bonus), self.names[item_id]
+
+            if limit is None:
+                ranked = sorted(scores.items(), key=rank)
+            else:
+                ranked = heapq.nsmallest(limit, scores.items(), key=rank)
+            return [self.items[item_id] for item_id, score in ranked]
+
+
+_index = SearchIndex()
+
+
+def get_search_index():
+    catalog = get_catalog()
+    if _index.version != catalog.version:
+        with _index.lock:
+            if _index.version != catalog.version:
+                _index.sync(catalog)
+    return _index
+
+
+def search_menu(query, limit=10):
+    return get_search_index().search(query, min(limit, MAX_RESULTS))
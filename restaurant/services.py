@@ -0,0 +1,166 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .db import retry_on_busy
+from .models import Cart, CartItem, MenuItem, OrderItem
+from .tasks import send_order_receipt
+
+TAX_RATE = Decimal('0.10')
+
+
+def get_cart_items(cart):
+    return list(cart.items.select_related('menu_item'))
+
+
+class CartOperationError(ValueError):
+    pass
+
+
+def _create_line(line, cart, menu_item, quantity, value):
+    """Create the cart's line for ``menu_item``, or set it to ``value`` if it now exists."""
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, menu_item=menu_item, quantity=quantity)
+    except IntegrityError:
+        # Another request created the line first.
+        line.update(quantity=value)
+
+
+@retry_on_busy
+def increment_cart_item(cart, menu_item, quantity=1):
+    """Add ``quantity`` of ``menu_item`` to ``cart`` with a database-side increment.
+
+    Concurrent adds for the same line never lose an increment.
+    """
+    line = CartItem.objects.filter(cart=cart, menu_item=menu_item)
+    with transaction.atomic():
+        if not line.update(quantity=F('quantity') + quantity):
+            _create_line(line, cart, menu_item, quantity, F('quantity') + quantity)
+        cart.adjust_totals(quantity, menu_item.price)
+
+
+@retry_on_busy
+def set_cart_item_quantity(cart_item, quantity):
+    """Set a cart line to ``quantity``, removing it at zero, and shift the cart totals.
+
+    The write is conditional on the line still holding the quantity that was
+    read; if another request changed it first, the totals are recomputed.
+    """
+    unchanged = CartItem.objects.filter(pk=cart_item.pk, quantity=cart_item.quantity)
+    with transaction.atomic():
+        if quantity > 0:
+            changed = unchanged.update(quantity=quantity)
+        else:
+            changed, _ = unchanged.delete()
+        if changed:
+            cart_item.cart.adjust_totals(max(quantity, 0) - cart_item.quantity, cart_item.menu_item.price)
+            return
+        if quantity > 0:
+            CartItem.objects.filter(pk=cart_item.pk).update(quantity=quantity)
+        else:
+            CartItem.objects.filter(pk=cart_item.pk).delete()
+        cart_item.cart.recalculate()
+
+
+@retry_on_busy
+def apply_cart_operations(cart, operations):
+    """Apply a batch of cart operations in one transaction.
+
+    Each operation is a dict with ``op`` (``add``, ``update`` or ``remove``),
+    ``item`` (a menu item id) and, except for ``remove``, ``quantity``.
+    Raises CartOperationError, leaving the cart untouched, if any operation
+    is invalid.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError('operations must be a non-empty list.')
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            op = operation['op']
+            item_id = int(operation['item'])
+            quantity = int(operation.get('quantity', 1)) if op != 'remove' else 0
+        except (KeyError, TypeError, ValueError):
+            raise CartOperationError(f'Operation {index} is malformed.')
+        if op not in ('add', 'update', 'remove') or quantity < 0 or (op == 'add' and quantity < 1):
+            raise CartOperationError(f'Operation {index} is invalid.')
+        parsed.append((op, item_id, quantity))
+
+    menu_items = MenuItem.objects.in_bulk({item_id for op, item_id, quantity in parsed})
+    with transaction.atomic():
+        for index, (op, item_id, quantity) in enumerate(parsed):
+            menu_item = menu_items.get(item_id)
+            if op == 'add' and (menu_item is None or not menu_item.is_available):
+                raise CartOperationError(f'Operation {index}: menu item {item_id} is not available.')
+            line = CartItem.objects.filter(cart=cart, menu_item_id=item_id)
+            if op == 'add':
+                if not line.update(quantity=F('quantity') + quantity):
+                    _create_line(line, cart, menu_item, quantity, F('quantity') + quantity)
+            elif quantity > 0:
+                if not line.update(quantity=quantity):
+                    if menu_item is None or not menu_item.is_available:
+                        raise CartOperationError(f'Operation {index}: menu item {item_id} is not available.')
+                    _create_line(line, cart, menu_item, quantity, quantity)
+            else:
+                line.delete()
+        cart.recalculate()
+    return cart
+
+
+def split_totals(subtotal):
+    tax = subtotal * TAX_RATE
+    return subtotal, tax, subtotal + tax
+
+
+def calculate_totals(cart_items):
+    return split_totals(sum((item.subtotal for item in cart_items), Decimal('0')))
+
+
+class EmptyCartError(ValueError):
+    pass
+
+
+def _discard_attempt(order, cart):
+    # The rolled-back attempt left its primary key and token on the instance.
+    order.pk = None
+    order.token_number = ''
+    order._state.adding = True
+
+
+@retry_on_busy(on_retry=_discard_attempt)
+def place_order(order, cart):
+    """Write ``order`` from the lines in ``cart`` and take them out of it.
+
+    The lines are read inside the transaction and only those are removed, so
+    a line added from another tab meanwhile is either ordered or left in the
+    cart. Raises ``EmptyCartError`` if there is nothing to order. The query
+    count does not depend on the number of cart lines. Side effects such as
+    the receipt email are queued for the task worker.
+    """
+    with transaction.atomic():
+        # Every cart change writes the cart row, so writing it first orders
+        # this read after them (and takes SQLite's write lock up front).
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        cart_items = get_cart_items(cart)
+        if not cart_items:
+            raise EmptyCartError('The cart is empty.')
+        order.subtotal, order.tax, order.total = calculate_totals(cart_items)
+        order.save()
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                menu_item=cart_item.menu_item,
+                menu_item_name=cart_item.menu_item.name,
+                quantity=cart_item.quantity,
+                price=cart_item.menu_item.price,
+                subtotal=cart_item.subtotal,
+            )
+            for cart_item in cart_items
+        ])
+        cart.remove_lines(cart_items)
+        # Queued with the order, so the receipt is sent exactly when it commits.
+        if order.customer_email:
+            send_order_receipt.enqueue(order_id=order.pk)
+    return order
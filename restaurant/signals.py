@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from . import thumbnails
+from .archive import is_archiving
+from .auth import forget_user
+from .catalog import invalidate_catalog
+from .instrumentation import record_query
+from .models import Category, MenuItem, Cart, Order
+from .rollups import record_order
+
+
+@receiver(pre_delete, sender=MenuItem)
+def remember_affected_carts(sender, instance, **kwargs):
+    instance._affected_cart_ids = list(
+        Cart.objects.filter(items__menu_item=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=MenuItem)
+def refresh_affected_carts(sender, instance, **kwargs):
+    # The menu item's cart lines were cascade-deleted along with it.
+    cart_ids = getattr(instance, '_affected_cart_ids', None)
+    if cart_ids:
+        Cart.refresh_totals(Cart.objects.filter(pk__in=cart_ids))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def bump_catalog_version(sender, **kwargs):
+    # Wait for the commit so no worker rebuilds from uncommitted data.
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=MenuItem)
+def schedule_thumbnails(sender, instance, **kwargs):
+    if instance.image and not thumbnails.is_ready(instance.image.name):
+        thumbnails.schedule(instance.image.name)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_rollup(sender, instance, **kwargs):
+    if is_archiving():
+        # Archived orders still count towards their day's sales.
+        return
+    record_order(instance, sign=-1)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
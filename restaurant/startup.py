@@ -0,0 +1,93 @@
+"""
+Boot-time work for web workers.
+
+Under the lean serving profile (``SERVING_PROFILE=lean``) the admin skips
+autodiscovery at boot, and ``wsgi.py`` calls ``warm_up()`` once the
+application is loaded. Warm-up imports the URLconf and views, compiles this
+app's templates into the cached loader, and builds the menu catalog and
+search index. The first request then finds them ready. Loaded in the
+process manager's master (``gunicorn --preload``), forked workers inherit
+all of it. ``deferred_include()`` keeps the admin's URLconf, and with it
+every ``ModelAdmin``, unloaded until a URL under ``admin/`` is used.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import get_resolver
+from django.urls.resolvers import RoutePattern, URLResolver
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredURLResolver(URLResolver):
+    """A namespaced include whose URLconf is imported on first use."""
+
+    @property
+    def loaded(self):
+        return 'urlconf_module' in self.__dict__
+
+    def _populate(self):
+        # The root resolver populates every include on the first reverse(),
+        # though it only keeps a namespaced include's name. URLs under the
+        # namespace are resolved and reversed through url_patterns, which
+        # imports the URLconf then.
+        if self.loaded:
+            super()._populate()
+
+
+def deferred_include(route, urlconf, namespace):
+    return DeferredURLResolver(RoutePattern(route, is_endpoint=False), urlconf, app_name=namespace, namespace=namespace)
+
+
+def preload_templates(app_label='restaurant'):
+    """Compile the app's templates into the cached loader; returns how many."""
+    directory = Path(apps.get_app_config(app_label).path) / 'templates'
+    count = 0
+    for path in sorted(directory.rglob('*')):
+        if not path.is_file():
+            continue
+        try:
+            get_template(path.relative_to(directory).as_posix())
+        except TemplateSyntaxError:
+            logger.exception('Could not preload template %s', path)
+            continue
+        count += 1
+    return count
+
+
+def warm_catalog():
+    from .search import get_search_index
+
+    index = get_search_index()
+    return len(index.items)
+
+
+def warm_up():
+    """Load what the first request would; returns timings in milliseconds."""
+    timings = {}
+    start = time.perf_counter()
+    get_resolver().reverse('home')
+    timings['urls'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    templates = preload_templates()
+    timings['templates'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    try:
+        items = warm_catalog()
+    except DatabaseError:
+        # Not migrated yet, or the database is down; the first request will retry.
+        logger.warning('Menu catalog warm-up failed', exc_info=True)
+        items = 0
+    finally:
+        # Don't hand an open connection to forked workers.
+        connections.close_all()
+    timings['catalog'] = (time.perf_counter() - start) * 1000
+    logger.info('Warmed up %d templates and %d menu items in %.0f ms', templates, items, sum(timings.values()))
+    return timings
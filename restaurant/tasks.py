@@ -0,0 +1,164 @@
+"""
+A small database-backed task queue.
+
+Functions decorated with ``@task`` are enqueued with ``func.enqueue(**kwargs)``,
+which inserts a ``Task`` row in the caller's transaction: work queued by a
+checkout commits (or rolls back) together with the order, and checkout
+returns without waiting for it. The ``run_tasks`` management command claims
+due rows and runs them on a thread pool. A failed task is retried with
+exponential backoff (``settings.TASK_RETRY_BACKOFF`` seconds, doubled per
+attempt) until it reaches ``max_attempts``, then left as ``failed`` with its
+traceback. Claims are conditional updates, so several workers can share
+the table without a broker; a task whose worker died is picked up again
+after ``settings.TASK_LOCK_TIMEOUT`` seconds.
+"""
+import functools
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .db import retry_on_busy
+
+_registry = {}
+_periodic = {}
+
+
+def task(func=None, *, name=None, max_attempts=None, every=None):
+    """Register ``func`` as a task and give it an ``enqueue(**kwargs)`` method.
+
+    Arguments must be JSON-serializable; pass ids rather than model instances.
+    With ``every`` (seconds, or a callable returning them) the worker also
+    keeps one run of the task queued at that interval.
+    """
+    if func is None:
+        return functools.partial(task, name=name, max_attempts=max_attempts, every=every)
+    task_name = name or f'{func.__module__}.{func.__qualname__}'
+    _registry[task_name] = func
+    if every is not None:
+        _periodic[task_name] = every
+
+    def enqueue(run_at=None, **kwargs):
+        return enqueue_task(task_name, kwargs, run_at=run_at, max_attempts=max_attempts)
+
+    func.task_name = task_name
+    func.enqueue = enqueue
+    return func
+
+
+def enqueue_task(name, payload=None, run_at=None, max_attempts=None):
+    from .models import Task
+
+    if name not in _registry:
+        raise LookupError(f'No task named "{name}" is registered.')
+    return Task.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 5),
+    )
+
+
+def schedule_periodic():
+    """Queue the next run of each periodic task that has none pending; returns how many were queued."""
+    from .models import Task
+
+    pending = set(Task.objects.filter(name__in=_periodic, status__in=['queued', 'running']).values_list('name', flat=True))
+    queued = 0
+    for name, every in _periodic.items():
+        if name in pending:
+            continue
+        last = Task.objects.filter(name=name).exclude(status__in=['queued', 'running']).order_by('-updated_at').first()
+        interval = timedelta(seconds=every() if callable(every) else every)
+        enqueue_task(name, run_at=last.updated_at + interval if last else None)
+        queued += 1
+    return queued
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'TASK_RETRY_BACKOFF', 30) * 2 ** (attempts - 1))
+
+
+@retry_on_busy
+def claim(worker_id, limit=10):
+    """Mark up to ``limit`` due tasks as running for ``worker_id``; returns them."""
+    from .models import Task
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 600))
+    due = Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=stale)
+    claimed = []
+    with transaction.atomic():
+        for candidate in Task.objects.filter(due).values('pk', 'status', 'locked_at')[:limit]:
+            # Only one worker's update matches the values it read.
+            won = Task.objects.filter(**candidate).update(
+                status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+            )
+            if won:
+                claimed.append(candidate['pk'])
+    return list(Task.objects.filter(pk__in=claimed))
+
+
+@retry_on_busy
+def _finish(task_id, worker_id, **fields):
+    from .models import Task
+
+    # Skipped if the lock timed out and another worker took the task over.
+    Task.objects.filter(pk=task_id, status='running', locked_by=worker_id).update(
+        locked_at=None, updated_at=timezone.now(), **fields,
+    )
+
+
+def run_task(task_row):
+    """Run one claimed task and record the outcome; returns the new status."""
+    try:
+        func = _registry[task_row.name]
+        func(**task_row.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if task_row.attempts < task_row.max_attempts:
+            status = 'queued'
+            _finish(task_row.pk, task_row.locked_by, status=status, last_error=error,
+                    run_at=timezone.now() + retry_delay(task_row.attempts))
+        else:
+            status = 'failed'
+            _finish(task_row.pk, task_row.locked_by, status=status, last_error=error)
+    else:
+        status = 'done'
+        _finish(task_row.pk, task_row.locked_by, status=status, last_error='')
+    return status
+
+
+def run_pending(worker_id='inline', limit=100, executor=None, runner=run_task):
+    """Claim and run due tasks, on ``executor`` if given; returns their statuses."""
+    tasks = claim(worker_id, limit)
+    if executor is None:
+        return [runner(task_row) for task_row in tasks]
+    return list(executor.map(runner, tasks))
+
+
+def purge_finished(older_than):
+    from .models import Task
+
+    return Task.objects.filter(status='done', updated_at__lt=timezone.now() - older_than).delete()[0]
+
+
+@task
+def send_order_receipt(order_id):
+    from .models import Order
+
+    order = Order.objects.prefetch_related('items').get(pk=order_id)
+    if not order.customer_email:
+        return
+    context = {'order': order, 'items': order.items.all()}
+    send_mail(
+        f'Your order {order.token_number}',
+        render_to_string('restaurant/email/order_receipt.txt', context),
+        None,
+        [order.customer_email],
+    )
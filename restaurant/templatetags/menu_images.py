@@ -0,0 +1,22 @@
+from django import template
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from restaurant import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def menu_picture(image, alt, sizes='100vw', css_class='', style=''):
+    """A ``<picture>`` serving ``image`` as WebP with a JPEG fallback at every thumbnail width."""
+    srcsets = thumbnails.srcsets(image.name)
+    sources = [
+        format_html('<source type="{}" srcset="{}" sizes="{}">', mime, srcsets[fmt], sizes)
+        for fmt, (encoder, mime) in thumbnails.FORMATS.items() if fmt != thumbnails.FALLBACK_FORMAT
+    ]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" style="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        mark_safe(''.join(sources)),
+        image.url, srcsets[thumbnails.FALLBACK_FORMAT], sizes, css_class, style, alt,
+    )
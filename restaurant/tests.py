@@ -1,3 +1,1430 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.db import OperationalError, connection, connections, router, transaction
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.urls.resolvers import RegexPattern, URLResolver
+from django.utils import timezone
+from PIL import Image
+
+from .benchmarks import SCENARIOS, STARTUP_TIMINGS, compare, run, seed, startup
+from .db import retry_on_busy
+from .exports import export_lines
+from .archive import archive_old_orders, archive_orders
+from .auth import CachedModelBackend, clear_user_cache
+from .models import (
+    Category, MenuItem, Cart, CartItem, Order, OrderItem, ArchivedOrder, TokenSequence, DailySalesSummary, ItemStats, Task,
+)
+from .context_processors import cart_count
+from .kitchen import InProcessBroker, event_stream
+from .menu_import import MenuImportError, import_menu
+from .instrumentation import registry
+from . import thumbnails
+from .catalog import build_catalog, get_catalog, get_catalog_version, invalidate_catalog
+from .routers import PIN_COOKIE, ReplicaPinningMiddleware, replica_reads
+from .recommendations import recommendations_for, refresh_recommendations, update_recommendations
+from .rollups import ACTIVE_STATUSES, day_range, rebuild_daily_sales, sales_overview
+from .search import SearchIndex, search_menu
+from .startup import deferred_include, preload_templates, warm_up
+from .services import (
+    apply_cart_operations, get_cart_items, increment_cart_item, place_order, set_cart_item_quantity,
+)
+from .tasks import claim, run_pending, run_task, schedule_periodic, send_order_receipt, task
+from .tokens import next_token_number, reserve_tokens, reset_token_blocks
+
+
+def make_menu_item(name='Burger', price='9.50', category=None):
+    if category is None:
+        category = Category.objects.create(name='Mains')
+    return MenuItem.objects.create(category=category, name=name, description=name, price=Decimal(price))
+
+
+def make_order(user, total='10.00', status='completed', days_ago=None, created_at=None, lines=0, customer_name='A'):
+    order = Order.objects.create(
+        user=user, customer_name=customer_name, customer_phone='1', status=status,
+        subtotal=Decimal(total), tax=Decimal('0'), total=Decimal(total),
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, menu_item_name=f'Dish {n}', quantity=1, price=Decimal('5'), subtotal=Decimal('5'))
+        for n in range(lines)
+    )
+    if days_ago is not None:
+        created_at = timezone.now() - timedelta(days=days_ago)
+    if created_at is not None:
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+    return order
+
+
+CHECKOUT_DATA = {
+    'customer_name': 'Test Customer',
+    'customer_phone': '555-0100',
+    'customer_email': 'test@example.com',
+    'payment_method': 'cash',
+    'notes': '',
+}
+
+
+class TokenSequenceTests(TestCase):
+    def tearDown(self):
+        reset_token_blocks()
+
+    def test_tokens_are_sequential(self):
+        first = next_token_number()
+        second = next_token_number()
+        self.assertEqual(int(second[1:]), int(first[1:]) + 1)
+
+    def test_does_not_read_orders_table(self):
+        with CaptureQueriesContext(connection) as ctx:
+            next_token_number()
+        self.assertFalse(any('restaurant_order' in q['sql'] for q in ctx.captured_queries))
+
+    @override_settings(ORDER_TOKEN_DAILY_RESET=True, ORDER_TOKEN_START=1)
+    def test_daily_reset_uses_per_day_sequence(self):
+        token = next_token_number()
+        self.assertTrue(token.startswith('#'))
+        self.assertTrue(token.endswith('-1'))
+        self.assertTrue(TokenSequence.objects.filter(key__contains='-').exists())
+
+    @override_settings(ORDER_TOKEN_BLOCK_SIZE=10)
+    def test_block_allocation_serves_from_memory(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = next_token_number()
+        with self.assertNumQueries(0):
+            for _ in range(9):
+                next_token_number()
+        self.assertEqual(
+            TokenSequence.objects.get(key='global').last_value,
+            int(first[1:]) + 9,
+        )
+
+
+    @override_settings(ORDER_TOKEN_BLOCK_SIZE=10)
+    def test_rolled_back_block_is_not_served_again(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(next_token_number(), '#1001')
+            raise RuntimeError
+        # Another process reserves the numbers the rollback gave back.
+        self.assertEqual(reserve_tokens('global', 10), 1001)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(next_token_number(), '#1011')
+        self.assertEqual(next_token_number(), '#1012')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    checkouts = 200
+
+    def test_parallel_checkouts_get_unique_tokens(self):
+        item = make_menu_item()
+        users = User.objects.bulk_create(
+            User(username=f'user{i}') for i in range(self.checkouts)
+        )
+        carts = Cart.objects.bulk_create(Cart(user=user) for user in users)
+        CartItem.objects.bulk_create(CartItem(cart=cart, menu_item=item, quantity=2) for cart in carts)
+
+        # Log in up front so the threads race on checkout, not on session inserts.
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        def checkout(client):
+            try:
+                return client.post(reverse('checkout'), CHECKOUT_DATA).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            statuses = list(pool.map(checkout, clients))
+
+        self.assertEqual(statuses, [302] * self.checkouts)
+        tokens = list(Order.objects.values_list('token_number', flat=True))
+        self.assertEqual(len(tokens), self.checkouts)
+        self.assertEqual(len(set(tokens)), self.checkouts)
+
+
+class BenchmarkTests(TransactionTestCase):
+    def test_seed_is_idempotent_and_run_covers_every_scenario(self):
+        seed(items=30, users=4, orders=60, categories=3)
+        seed(items=30, users=4, orders=60, categories=3)
+        self.assertEqual((MenuItem.objects.count(), Order.objects.count()), (30, 60))
+        self.assertEqual(
+            sum(DailySalesSummary.objects.values_list('order_count', flat=True)), 60
+        )
+
+        results = run(concurrency=2, iterations=2)
+        self.assertEqual(set(results), set(SCENARIOS))
+        for name, result in results.items():
+            self.assertEqual((result['requests'], result['errors']), (4, 0))
+            if name == 'search':
+                # Answered from the in-memory index.
+                self.assertEqual(result['queries']['median'], 0)
+            else:
+                self.assertGreater(result['queries']['median'], 0)
+        self.assertEqual(Order.objects.count(), 64)
+
+    def test_startup_boots_each_profile_and_serves_the_first_request(self):
+        database = connections['default'].settings_dict['NAME']
+        for profile in ('full', 'lean'):
+            result = startup(runs=1, path=reverse('login'), database=database, env={'SERVING_PROFILE': profile})
+            self.assertEqual(result['status'], [200], profile)
+            for name in STARTUP_TIMINGS:
+                self.assertGreater(result[name]['median'], 0)
+
+    def test_compare_flags_latency_and_query_regressions(self):
+        def report(p95, queries):
+            return {'scenarios': {'menu': {'latency_ms': {'p95': p95}, 'queries': {'median': queries}}}}
+        self.assertEqual(compare(report(10, 3), report(11, 3)), [])
+        self.assertEqual(len(compare(report(10, 3), report(15, 4))), 2)
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def test_production_profile_applies_pragmas_and_immediate_transactions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = {**connections['default'].settings_dict, **settings.SQLITE_PRODUCTION_PROFILE}
+            config['NAME'] = str(Path(directory) / 'profiled.sqlite3')
+            profiled = type(connections['default'])(config, alias='profiled')
+            try:
+                with profiled.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)
+                self.assertEqual(profiled.transaction_mode, 'IMMEDIATE')
+            finally:
+                profiled.close()
+
+    @override_settings(DB_BUSY_BACKOFF=0)
+    def test_retry_on_busy_only_retries_lock_errors(self):
+        calls, retries = [], []
+
+        @retry_on_busy(on_retry=lambda: retries.append(1))
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        @retry_on_busy
+        def broken():
+            calls.append(1)
+            raise OperationalError('no such table: restaurant_order')
+
+        self.assertEqual(flaky(), 'done')
+        self.assertEqual((len(calls), len(retries)), (3, 2))
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            broken()
+        self.assertEqual(len(calls), 1)
+
+
+class BusyCheckoutTests(TransactionTestCase):
+    @override_settings(DB_BUSY_BACKOFF=0)
+    def test_checkout_is_retried_from_scratch_when_locked(self):
+        user = User.objects.create_user('diner', password='pw')
+        cart = Cart.objects.create(user=user)
+        increment_cart_item(cart, make_menu_item())
+        order = Order(user=user, customer_name='A', customer_phone='1')
+        real_bulk_create = OrderItem.objects.bulk_create
+        attempts = []
+
+        def locked_once(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return real_bulk_create(*args, **kwargs)
+
+        with mock.patch.object(OrderItem.objects, 'bulk_create', locked_once):
+            place_order(order, cart)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(Order.objects.get().pk, order.pk)
+        self.assertEqual(OrderItem.objects.get().order_id, order.pk)
+        self.assertEqual(Cart.objects.get().item_count, 0)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name='Mains')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, lines):
+        for i in range(lines):
+            item = make_menu_item(f'Dish {i}', '4.00', self.category)
+            CartItem.objects.create(cart=self.cart, menu_item=item, quantity=2)
+
+    def checkout_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('checkout'), CHECKOUT_DATA)
+        self.assertEqual(response.status_code, 302)
+        return len(ctx.captured_queries)
+
+    def test_checkout_writes_order_and_clears_cart(self):
+        self.fill_cart(3)
+        self.client.post(reverse('checkout'), CHECKOUT_DATA)
+        order = Order.objects.get()
+        self.assertEqual(order.subtotal, Decimal('24.00'))
+        self.assertEqual(order.tax, Decimal('2.40'))
+        self.assertEqual(order.total, Decimal('26.40'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_line_added_from_another_tab_is_ordered_not_dropped(self):
+        self.fill_cart(1)
+        late = make_menu_item('Late', '5.00', self.category)
+        real_get_cart_items = get_cart_items
+
+        def read_then_add(cart):
+            lines = real_get_cart_items(cart)
+            increment_cart_item(cart, late)
+            return lines
+
+        with mock.patch('restaurant.views.get_cart_items', read_then_add):
+            self.client.post(reverse('checkout'), CHECKOUT_DATA)
+        order = Order.objects.get()
+        self.assertEqual(sorted(order.items.values_list('menu_item_name', flat=True)), ['Dish 0', 'Late'])
+        self.assertEqual(order.subtotal, Decimal('13.00'))
+        cart = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual((cart.item_count, cart.total), (0, Decimal('0')))
+
+    def test_lines_outside_the_order_stay_in_the_cart(self):
+        self.fill_cart(2)
+        ordered = get_cart_items(self.cart)[:1]
+        self.cart.remove_lines(ordered)
+        self.assertEqual(list(self.cart.items.values_list('menu_item__name', flat=True)), ['Dish 1'])
+        self.assertEqual((self.cart.item_count, self.cart.total), (2, Decimal('8.00')))
+
+    def test_empty_cart_at_commit_places_no_order(self):
+        self.fill_cart(1)
+        real_get_cart_items = get_cart_items
+
+        def read_then_empty(cart):
+            lines = real_get_cart_items(cart)
+            cart.clear()
+            return lines
+
+        with mock.patch('restaurant.views.get_cart_items', read_then_empty):
+            response = self.client.post(reverse('checkout'), CHECKOUT_DATA)
+        self.assertRedirects(response, reverse('menu'))
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(1)
+        self.checkout_queries()  # creates today's sales rollup row
+        self.fill_cart(1)
+        small = self.checkout_queries()
+        self.fill_cart(20)
+        large = self.checkout_queries()
+        self.assertEqual(small, large)
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        self.burger = make_menu_item('Burger', '9.50')
+        self.fries = make_menu_item('Fries', '3.00', self.burger.category)
+
+    def cart(self):
+        return Cart.objects.get(user=self.user)
+
+    def test_mutations_keep_running_totals(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        self.client.post(reverse('add_to_cart', args=[self.fries.id]))
+        cart = self.cart()
+        self.assertEqual((cart.item_count, cart.total), (3, Decimal('22.00')))
+
+        fries_line = cart.items.get(menu_item=self.fries)
+        self.client.post(reverse('update_cart', args=[fries_line.id]), {'quantity': 4})
+        cart = self.cart()
+        self.assertEqual((cart.item_count, cart.total), (6, Decimal('31.00')))
+
+        self.client.post(reverse('remove_from_cart', args=[fries_line.id]))
+        cart = self.cart()
+        self.assertEqual((cart.item_count, cart.total), (2, Decimal('19.00')))
+
+    def test_price_change_recomputes_carts(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        burger = MenuItem.objects.get(pk=self.burger.pk)
+        burger.price = Decimal('12.25')
+        burger.save()
+        self.assertEqual(self.cart().total, Decimal('12.25'))
+
+    def test_deleting_menu_item_recomputes_carts(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        self.client.post(reverse('add_to_cart', args=[self.fries.id]))
+        self.fries.delete()
+        cart = self.cart()
+        self.assertEqual((cart.item_count, cart.total), (1, Decimal('9.50')))
+
+    def test_reading_totals_costs_no_queries(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        cart = self.cart()
+        with self.assertNumQueries(0):
+            cart.total, cart.item_count
+
+    def test_stale_line_writes_do_not_lose_updates(self):
+        cart = Cart.objects.create(user=self.user)
+        increment_cart_item(cart, self.burger)
+        stale = cart.items.select_related('cart', 'menu_item').get()
+        increment_cart_item(Cart.objects.get(pk=cart.pk), self.burger)
+        self.assertEqual(cart.items.get().quantity, 2)
+
+        set_cart_item_quantity(stale, 5)
+        cart = self.cart()
+        self.assertEqual((cart.items.get().quantity, cart.item_count, cart.total), (5, 5, Decimal('47.50')))
+
+    def test_batch_endpoint_applies_all_operations(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        response = self.client.post(reverse('cart_batch'), json.dumps({'operations': [
+            {'op': 'add', 'item': self.fries.id, 'quantity': 3},
+            {'op': 'update', 'item': self.burger.id, 'quantity': 2},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item_count'], 5)
+        self.assertEqual(response.json()['total'], '28.00')
+
+        self.client.post(reverse('cart_batch'), json.dumps({'operations': [
+            {'op': 'remove', 'item': self.fries.id},
+        ]}), content_type='application/json')
+        cart = self.cart()
+        self.assertEqual((cart.item_count, cart.total), (2, Decimal('19.00')))
+
+    def test_invalid_batch_leaves_cart_untouched(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        self.fries.is_available = False
+        self.fries.save()
+        response = self.client.post(reverse('cart_batch'), json.dumps({'operations': [
+            {'op': 'update', 'item': self.burger.id, 'quantity': 4},
+            {'op': 'add', 'item': self.fries.id},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        cart = self.cart()
+        self.assertEqual((cart.items.get().quantity, cart.item_count), (1, 1))
+
+    def test_batch_rejects_negative_quantities(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        response = self.client.post(reverse('cart_batch'), json.dumps({'operations': [
+            {'op': 'update', 'item': self.burger.id, 'quantity': -1},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart().items.get().quantity, 1)
+
+    def test_batch_add_survives_a_concurrent_add(self):
+        cart = Cart.objects.create(user=self.user)
+        real_update = QuerySet.update
+        raced = []
+
+        def update_after_another_add(queryset, **kwargs):
+            if queryset.model is CartItem and not raced:
+                # Another request adds the line just after this one found none.
+                raced.append(1)
+                CartItem.objects.create(cart=cart, menu_item=self.fries, quantity=2)
+                return 0
+            return real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_after_another_add):
+            apply_cart_operations(cart, [{'op': 'add', 'item': self.fries.id, 'quantity': 3}])
+        cart = self.cart()
+        self.assertEqual((cart.items.get().quantity, cart.item_count, cart.total), (5, 5, Decimal('15.00')))
+
+
+class MenuCatalogTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        self.burger = make_menu_item('Burger', '9.50')
+        self.salad = make_menu_item('Salad', '7.00', Category.objects.create(name='Starters'))
+
+    def test_snapshot_indexes_available_items_by_category(self):
+        catalog = get_catalog()
+        self.assertEqual(catalog.items_for(self.burger.category_id), [self.burger])
+        self.assertEqual(catalog.items_for('not-a-number'), [])
+        self.assertEqual(len(catalog.categories), 2)
+
+    def test_menu_is_served_from_memory(self):
+        self.client.get(reverse('menu'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('menu'), {'category': self.salad.category_id})
+        self.assertContains(response, 'Salad')
+        self.assertNotContains(response, 'Burger')
+        self.assertFalse(any('restaurant_menuitem' in q['sql'] for q in ctx.captured_queries))
+
+    def test_writes_bump_version_and_rebuild(self):
+        get_catalog()
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(User.objects.create_user('chef', password='pw', is_staff=True))
+            self.client.get(reverse('menuitem_toggle', args=[self.burger.id]))
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual(get_catalog().items, [self.salad])
+
+
+class MenuConditionalGetTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        self.burger = make_menu_item('Burger', '9.50')
+
+    def test_repeat_visit_gets_304_without_rendering(self):
+        self.client.get(reverse('menu'))  # sets the CSRF cookie
+        response = self.client.get(reverse('menu'))
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        with self.assertTemplateNotUsed('restaurant/menu.html'):
+            repeat = self.client.get(reverse('menu'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_etag_changes_with_catalog_and_category(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        filtered = self.client.get(reverse('menu'), {'category': self.burger.category_id})
+        self.assertNotEqual(filtered['ETag'], self.client.get(reverse('menu'))['ETag'])
+        invalidate_catalog()
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_grid_keeps_add_to_cart_working(self):
+        self.client.get(reverse('menu'))
+        response = self.client.get(reverse('menu'))
+        self.assertContains(response, 'form="add-to-cart-form"')
+        self.assertContains(response, reverse('add_to_cart', args=[self.burger.id]))
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('manager', password='pw')
+        self.client.force_login(self.user)
+
+    def summary(self):
+        return DailySalesSummary.objects.get(date=timezone.localdate())
+
+    def test_rollup_tracks_creates_and_status_changes(self):
+        make_order(self.user, '10.00')
+        order = make_order(self.user, '5.00', status='pending')
+        summary = self.summary()
+        self.assertEqual((summary.order_count, summary.revenue), (2, Decimal('10.00')))
+        self.assertEqual((summary.completed_count, summary.pending_count), (1, 1))
+
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'completed'
+        order.save()
+        summary = self.summary()
+        self.assertEqual((summary.revenue, summary.completed_count, summary.pending_count), (Decimal('15.00'), 2, 0))
+
+        order.delete()
+        self.assertEqual((self.summary().order_count, self.summary().revenue), (1, Decimal('10.00')))
+
+    def test_dashboard_combines_rollup_and_live_day(self):
+        today = timezone.localdate()
+        DailySalesSummary.objects.create(
+            date=today - timedelta(days=2), revenue=Decimal('100.00'), order_count=4, completed_count=3, ready_count=1,
+        )
+        make_order(self.user, '20.00')
+        make_order(self.user, '7.00', status='preparing')
+        with self.assertNumQueries(2):
+            overview = sales_overview(today)
+        self.assertEqual(overview['daily_revenue'], Decimal('20.00'))
+        self.assertEqual(overview['weekly_revenue'], Decimal('120.00'))
+        self.assertEqual(overview['total_revenue'], Decimal('120.00'))
+        self.assertEqual(overview['total_orders'], 4)
+        self.assertEqual(overview['pending_orders'], 2)
+        self.assertContains(self.client.get(reverse('analytics')), '120.00')
+
+    def test_rebuild_command_matches_incremental_rollup(self):
+        make_order(self.user, '10.00')
+        make_order(self.user, '3.00', status='cancelled')
+        incremental = list(DailySalesSummary.objects.values())
+        DailySalesSummary.objects.all().delete()
+        call_command('rebuild_sales_summary', stdout=StringIO())
+        rebuilt = list(DailySalesSummary.objects.values())
+        for row in incremental + rebuilt:
+            row.pop('id')
+            row.pop('updated_at')
+        self.assertEqual(rebuilt, incremental)
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('diner', password='pw')
+
+    def assertUsesIndexes(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            full_scan = 'Seq Scan' in line or (' SCAN ' in f' {line} ' and 'INDEX' not in line)
+            self.assertFalse(full_scan, f'Full table scan in plan:\n{plan}\n\n{queryset.query}')
+
+    def test_hot_filters_use_indexes(self):
+        start, end = day_range(timezone.localdate())
+        self.assertUsesIndexes(Order.objects.filter(user=self.user))
+        self.assertUsesIndexes(Order.objects.filter(status='completed', created_at__gte=start, created_at__lt=end))
+        self.assertUsesIndexes(Order.objects.filter(created_at__gte=start, created_at__lt=end))
+        self.assertUsesIndexes(Order.objects.filter(status__in=ACTIVE_STATUSES).order_by('created_at'))
+        self.assertUsesIndexes(CartItem.objects.filter(cart__user=self.user))
+        self.assertUsesIndexes(DailySalesSummary.objects.filter(date__lt=timezone.localdate()))
+        self.assertUsesIndexes(ArchivedOrder.objects.filter(user=self.user))
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('regular', password='pw')
+        self.client.force_login(self.user)
+
+    def add_orders(self, count, lines=2):
+        for _ in range(count):
+            make_order(self.user, lines=lines)
+
+    def page_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('orders'), params)
+        return response, len(ctx.captured_queries)
+
+    def test_keyset_pages_cover_history_once(self):
+        self.add_orders(45)
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('orders'), {'before': cursor} if cursor else {})
+            seen += [order.pk for order in response.context['orders']]
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)))
+        self.assertEqual(response.context['orders'][0].item_count, 2)
+
+    def test_query_count_does_not_depend_on_history_length(self):
+        self.add_orders(3)
+        short = self.page_queries()[1]
+        short_expanded = self.page_queries(expand='1')[1]
+        self.add_orders(60)
+        response, long = self.page_queries()
+        self.assertEqual(long, short)
+        self.assertEqual(self.page_queries(expand='1')[1], short_expanded)
+        self.assertContains(response, 'Older orders')
+
+
+class CartBadgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        self.burger = make_menu_item('Burger', '9.50')
+
+    def test_badge_never_creates_a_cart(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, 'class="badge badge-cart"')
+        self.assertFalse(Cart.objects.exists())
+
+    def test_badge_is_cached_and_refreshed_by_mutations(self):
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        self.client.post(reverse('add_to_cart', args=[self.burger.id]))
+        self.assertContains(self.client.get(reverse('home')), '<span class="badge badge-cart">2</span>', html=True)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('home'))
+        self.assertFalse(any('restaurant_cart' in q['sql'] for q in ctx.captured_queries))
+
+        line = CartItem.objects.get()
+        self.client.post(reverse('remove_from_cart', args=[line.id]))
+        self.assertNotContains(self.client.get(reverse('home')), 'class="badge badge-cart"')
+
+    def test_count_is_lazy(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            context = cart_count(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(context['cart_count'](), 0)
+
+    def test_count_is_looked_up_once_per_request(self):
+        with mock.patch.object(Cart, 'cached_item_count', return_value=2) as lookup:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, '<span class="badge badge-cart">2</span>')
+        lookup.assert_called_once_with(self.user)
+
+
+class RecordingBroker(InProcessBroker):
+    events = []
+    subscriber_count = 1
+
+    def publish(self, event):
+        self.events.append(event)
+        super().publish(event)
+
+
+@override_settings(KITCHEN_BROKER='restaurant.tests.RecordingBroker')
+class KitchenStreamTests(TestCase):
+    def setUp(self):
+        RecordingBroker.events = []
+        self.staff = User.objects.create_user('chef', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_new_orders_and_transitions_are_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = make_order(self.staff, status='pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('kitchen_advance', args=[order.id]))
+        self.assertEqual(response.json()['status'], 'preparing')
+        self.assertEqual(
+            [(event['type'], event['order']['status']) for event in RecordingBroker.events],
+            [('order_created', 'pending'), ('status_changed', 'preparing')],
+        )
+        self.assertEqual(RecordingBroker.events[1]['previous_status'], 'pending')
+
+    def test_checkout_orders_reach_the_kitchen(self):
+        cart = Cart.objects.create(user=self.staff)
+        increment_cart_item(cart, make_menu_item())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('checkout'), CHECKOUT_DATA)
+        order = Order.objects.get()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(
+            [(event['type'], event['order']['id'], event['order']['status']) for event in RecordingBroker.events],
+            [('order_created', order.id, 'pending')],
+        )
+        self.assertEqual(RecordingBroker.events[0]['order']['items'], [{'name': 'Burger', 'quantity': 1}])
+
+    async def test_checkout_orders_are_in_the_stream_snapshot(self):
+        await self.async_client.aforce_login(self.staff)
+        cart = await Cart.objects.acreate(user=self.staff)
+        await sync_to_async(increment_cart_item)(cart, await sync_to_async(make_menu_item)())
+        await self.async_client.post(reverse('checkout'), CHECKOUT_DATA)
+        order = await Order.objects.aget()
+        response = await self.async_client.get(reverse('kitchen_stream'))
+        stream = aiter(response.streaming_content)
+        snapshot = (await anext(stream)).decode()
+        await stream.aclose()
+        self.assertIn(f'"token_number": "{order.token_number}"', snapshot)
+        self.assertIn('"status": "pending"', snapshot)
+
+    def test_in_process_broker_streams_snapshot_and_events(self):
+        broker = InProcessBroker()
+
+        async def consume():
+            subscription = broker.subscribe()
+            stream = event_stream(subscription, [{'id': 1}], heartbeat=0.01)
+            chunks = [await anext(stream)]
+            chunks.append(await anext(stream))  # heartbeat while idle
+            threading.Thread(target=broker.publish, args=[{'type': 'order_created', 'order': {'id': 2}}]).start()
+            chunks.append(await anext(stream))
+            while chunks[-1].startswith(':'):
+                chunks[-1] = await anext(stream)
+            await stream.aclose()
+            return chunks
+
+        chunks = asyncio.run(consume())
+        self.assertTrue(chunks[0].startswith('event: snapshot\n'))
+        self.assertEqual(chunks[1], ': keepalive\n\n')
+        self.assertTrue(chunks[2].startswith('event: order_created\n'))
+        self.assertEqual(broker.subscriber_count, 0)
+
+    async def test_stream_view_starts_with_active_orders(self):
+        await self.async_client.aforce_login(self.staff)
+        order = await sync_to_async(make_order)(self.staff, status='pending')
+        response = await self.async_client.get(reverse('kitchen_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        snapshot = (await anext(stream)).decode()
+        await stream.aclose()
+        self.assertIn(order.token_number, snapshot)
+
+
+class JsonApiTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.user = User.objects.create_user('kiosk', password='pw')
+        self.burger = make_menu_item('Burger', '9.50')
+
+    def test_menu_supports_field_selection_and_etag(self):
+        response = self.client.get(reverse('api_menu'), {'fields': 'id,price'})
+        self.assertEqual(response.json()['items'], [{'id': self.burger.id, 'price': '9.50'}])
+        self.assertNotIn(b' ', response.content)
+        repeat = self.client.get(reverse('api_menu'), {'fields': 'id,price'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(self.client.get(reverse('api_menu'), {'fields': 'id,calories'}).status_code, 400)
+
+    def test_menu_category_is_parsed_before_use(self):
+        for bad in ['\n', 'a"b', 'x']:
+            response = self.client.get(reverse('api_menu'), {'category': bad})
+            self.assertEqual(response.status_code, 400)
+            self.assertNotIn('ETag', response)
+        category_id = self.burger.category_id
+        response = self.client.get(reverse('api_menu'), {'category': str(category_id)})
+        self.assertEqual([item['id'] for item in response.json()['items']], [self.burger.id])
+        padded = self.client.get(reverse('api_menu'), {'category': f'0{category_id}'})
+        self.assertEqual(padded['ETag'], response['ETag'])
+
+    def test_order_status_by_token(self):
+        order = make_order(self.user, status='preparing')
+        response = self.client.get(reverse('api_order_status', args=[order.token_number.lstrip('#')]))
+        self.assertEqual(response.json()['status'], 'preparing')
+        self.assertNotIn('customer_name', response.json())
+        self.assertEqual(self.client.get(reverse('api_order_status', args=['999999'])).status_code, 404)
+
+    def test_recent_orders_require_login(self):
+        self.assertEqual(self.client.get(reverse('api_recent_orders')).status_code, 401)
+        for _ in range(3):
+            make_order(self.user, status='preparing')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_recent_orders'), {'limit': 2, 'fields': 'token_number,total'})
+        self.assertEqual(len(response.json()['orders']), 2)
+        self.assertEqual(set(response.json()['orders'][0]), {'token_number', 'total'})
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        registry.reset()
+        self.staff = User.objects.create_user('manager', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def stats(self, view_name):
+        return dict(registry.summary())[view_name]
+
+    def test_server_timing_and_per_view_stats(self):
+        make_menu_item()
+        response = self.client.get(reverse('menu'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=')
+        stats = self.stats('menu')
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['queries']['p50'], 0)
+        self.assertGreater(stats['render_time']['p50'], 0)
+
+    def test_repeated_queries_are_flagged(self):
+        for name in ('Starters', 'Mains', 'Desserts'):
+            Category.objects.create(name=name)
+        self.client.get(reverse('category_list'))
+        stats = self.stats('category_list')
+        self.assertEqual(stats['n_plus_one'], 1)
+        self.assertEqual(stats['duplicate_sql'][0][1], 3)
+        page = self.client.get(reverse('performance_stats'))
+        self.assertContains(page, 'category_list')
+        self.assertContains(page, '1 with repeated queries')
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        response = self.client.get(reverse('menu'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.summary(), [])
+
+    def test_server_timing_is_only_sent_to_staff_or_under_debug(self):
+        self.client.logout()
+        response = self.client.get(reverse('menu'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.stats('menu')['requests'], 1)
+        self.client.force_login(User.objects.create_user('diner', password='pw'))
+        self.assertNotIn('Server-Timing', self.client.get(reverse('menu')))
+        self.client.logout()
+        with override_settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('menu')))
+        self.assertEqual(self.stats('menu')['requests'], 3)
+
+    async def test_async_views_are_instrumented(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('api_order_status', args=['1']))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_stats_page_is_staff_only(self):
+        self.client.force_login(User.objects.create_user('diner', password='pw'))
+        self.assertEqual(self.client.get(reverse('performance_stats')).status_code, 302)
+
+
+@mock.patch.dict(settings.DATABASES, {'replica': {}})
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_only_opted_in_reads_use_the_replica(self):
+        self.assertEqual(router.db_for_read(Order), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Order), 'replica')
+            self.assertEqual(router.db_for_write(Order), 'default')
+            with replica_reads(False):
+                self.assertEqual(router.db_for_read(Order), 'default')
+
+    def test_clients_are_pinned_to_the_primary_after_a_write(self):
+        seen = []
+
+        def view(request):
+            with replica_reads():
+                seen.append(router.db_for_read(Order))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        factory = RequestFactory()
+        self.assertNotIn(PIN_COOKIE, middleware(factory.get('/orders/')).cookies)
+        pin = middleware(factory.post('/checkout/')).cookies[PIN_COOKIE]
+        self.assertEqual(pin['max-age'], settings.REPLICA_LAG_SECONDS)
+        request = factory.get('/orders/')
+        request.COOKIES[PIN_COOKIE] = pin.value
+        middleware(request)
+        request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+        middleware(request)
+        self.assertEqual(seen, ['replica', 'replica', 'default', 'replica'])
+
+    def test_catalog_rebuilds_from_primary_right_after_a_change(self):
+        with mock.patch('restaurant.catalog.replica_reads', wraps=replica_reads) as reads, \
+                mock.patch('restaurant.catalog.CatalogSnapshot'), \
+                mock.patch('restaurant.models.MenuItem.objects'), mock.patch('restaurant.models.Category.objects'), \
+                mock.patch('restaurant.models.ItemStats.objects'):
+            build_catalog(time.time_ns())
+            build_catalog(time.time_ns() - 60 * 10 ** 9)
+        self.assertEqual([call.args[0] for call in reads.call_args_list], [False, True])
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('accountant', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+        today = timezone.localdate()
+        for days_ago, status, lines in ((0, 'completed', 2), (1, 'cancelled', 1), (3, 'completed', 3)):
+            make_order(
+                self.staff, status=status, lines=lines, customer_name=f'Customer {days_ago}',
+                created_at=day_range(today - timedelta(days=days_ago))[0],
+            )
+        self.today = today
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_orders'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_csv_has_a_row_per_item_filtered_by_date_and_status(self):
+        lines = self.export()
+        self.assertTrue(lines[0].startswith('order_id,token_number,created_at,status'))
+        self.assertEqual(len(lines), 1 + 6)
+        lines = self.export(**{'from': str(self.today - timedelta(days=1)), 'status': 'completed'})
+        self.assertEqual(len(lines), 1 + 2)
+        self.assertIn('Customer 0', lines[1])
+
+    def test_jsonl_nests_items_per_order(self):
+        orders = [json.loads(line) for line in self.export(format='jsonl')]
+        self.assertEqual([len(order['items']) for order in orders], [3, 1, 2])
+        self.assertEqual(orders[0]['items'][0], {'item': 'Dish 0', 'quantity': 1, 'price': '5.00', 'item_subtotal': '5.00'})
+
+    def test_export_is_one_streamed_query_per_table(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(export_lines('csv', chunk_size=2))), 7)
+
+    def test_invalid_filters_and_non_staff_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('export_orders'), {'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_orders'), {'from': '2024-13-01'}).status_code, 400)
+        self.client.force_login(User.objects.create_user('diner', password='pw'))
+        self.assertEqual(self.client.get(reverse('export_orders')).status_code, 302)
+
+    def test_command_writes_jsonl(self):
+        out = StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--status', 'cancelled', stdout=out)
+        self.assertEqual([json.loads(line)['status'] for line in out.getvalue().splitlines()], ['cancelled'])
+
+
+class MenuImportTests(TestCase):
+    CSV = (
+        'category,name,description,price,is_available\n'
+        'Mains,Burger,Beef burger,9.50,yes\n'
+        'Mains,Pasta,Fresh pasta,12.00,yes\n'
+        'Drinks,Lemonade,Cold,3.00,no\n'
+    )
+
+    def setUp(self):
+        self.staff = User.objects.create_user('chef', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+        mains = Category.objects.create(name='Mains')
+        self.burger = MenuItem.objects.create(category=mains, name='Burger', description='Beef burger', price=Decimal('8.00'))
+        self.soup = MenuItem.objects.create(category=mains, name='Soup', description='Hot', price=Decimal('5.00'))
+        self.cart = Cart.objects.create(user=self.staff)
+        increment_cart_item(self.cart, self.burger, 2)
+
+    def upload(self, content, name='menu.csv', **data):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('menu_import'), {'file': upload, **data})
+
+    def test_diff_is_applied_in_bulk_with_one_invalidation(self):
+        with mock.patch('restaurant.menu_import.invalidate_catalog') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                plan = import_menu(self.CSV, 'csv', withdraw_missing=True)
+        invalidate.assert_called_once_with()
+        self.assertEqual((len(plan.new_categories), len(plan.new_items), len(plan.changed_items)), (1, 2, 1))
+        self.assertEqual(plan.withdrawn_items, [self.soup])
+        self.burger.refresh_from_db()
+        self.assertEqual(self.burger.price, Decimal('9.50'))
+        self.assertFalse(MenuItem.objects.get(name='Lemonade').is_available)
+        self.assertFalse(MenuItem.objects.get(pk=self.soup.pk).is_available)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total, Decimal('19.00'))
+
+    def test_reimport_is_a_no_op(self):
+        import_menu(self.CSV, 'csv')
+        with self.assertNumQueries(2):
+            plan = import_menu(self.CSV, 'csv')
+        self.assertFalse(plan.has_changes)
+        self.assertEqual(plan.unchanged_items, 3)
+
+    def test_json_with_categories(self):
+        content = json.dumps({
+            'categories': [{'name': 'Mains', 'description': 'Big plates'}],
+            'items': [{'category': 'Mains', 'name': 'Salad', 'description': 'Green', 'price': '6.5'}],
+        })
+        plan = import_menu(content, 'json')
+        self.assertEqual(len(plan.changed_categories), 1)
+        self.assertEqual(Category.objects.get(name='Mains').description, 'Big plates')
+        self.assertEqual(MenuItem.objects.get(name='Salad').price, Decimal('6.50'))
+
+    def test_errors_are_reported_and_nothing_is_saved(self):
+        content = self.CSV + 'Mains,Burger,Again,1.00,yes\nMains,Pie,Apple,free,yes\n'
+        with self.assertRaises(MenuImportError) as raised:
+            import_menu(content, 'csv')
+        self.assertEqual(len(raised.exception.errors), 2)
+        self.assertFalse(MenuItem.objects.filter(name='Pasta').exists())
+
+    def test_staff_upload_dry_run_and_apply(self):
+        response = self.upload(self.CSV, dry_run='on')
+        self.assertContains(response, '2 new, 1 updated')
+        self.assertFalse(MenuItem.objects.filter(name='Pasta').exists())
+        response = self.upload(self.CSV)
+        self.assertRedirects(response, reverse('menuitem_list'))
+        self.assertTrue(MenuItem.objects.filter(name='Pasta').exists())
+        self.assertContains(self.upload('x', name='menu.txt'), 'Upload a .csv or .json file.')
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.CSV)
+        self.addCleanup(Path(f.name).unlink)
+        out = StringIO()
+        call_command('import_menu', f.name, '--dry-run', stdout=out)
+        self.assertIn('Dry run: 1 new and 0 updated categories', out.getvalue())
+        self.assertFalse(MenuItem.objects.filter(name='Pasta').exists())
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = Path(media.name)
+        overrides = override_settings(MEDIA_ROOT=media.name, THUMBNAIL_WIDTHS=(160, 320), THUMBNAIL_BACKGROUND=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.category = Category.objects.create(name='Mains')
+
+    def image_upload(self, name='burger.png', size=(800, 600)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 80, 20, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def create_item(self, **kwargs):
+        return MenuItem.objects.create(category=self.category, name='Burger', description='Beef', price=Decimal('9'), **kwargs)
+
+    def test_derivatives_are_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.create_item(image=self.image_upload())
+        self.assertTrue(thumbnails.is_ready(item.image.name))
+        for fmt in ('webp', 'jpg'):
+            with Image.open(self.media / thumbnails.derivative_name(item.image.name, 320, fmt)) as image:
+                self.assertEqual((image.format, image.size), (thumbnails.FORMATS[fmt][0], (320, 240)))
+
+    def test_small_originals_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.create_item(image=self.image_upload(size=(200, 100)))
+        with Image.open(self.media / thumbnails.derivative_name(item.image.name, 320, 'webp')) as image:
+            self.assertEqual(image.size, (200, 100))
+
+    @override_settings(THUMBNAIL_BACKGROUND=True)
+    def test_catalog_is_invalidated_once_per_batch(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_generate(name):
+            started.set()
+            release.wait(5)
+
+        with mock.patch('restaurant.thumbnails.generate', slow_generate), \
+                mock.patch('restaurant.thumbnails.invalidate_catalog') as invalidate:
+            for name in ('a.png', 'b.png', 'c.png'):
+                thumbnails._submit(name)
+            started.wait(5)
+            release.set()
+            # The single worker runs this after the batch has drained.
+            thumbnails._executor.submit(lambda: None).result(5)
+        invalidate.assert_called_once_with()
+
+    def test_missing_derivatives_are_served_lazily_and_cached(self):
+        item = self.create_item(image=self.image_upload())
+        url = reverse('menu_image_thumbnail', args=[160, 'webp', item.image.name])
+        with mock.patch('restaurant.thumbnails._submit') as submit:
+            html = Template('{% load menu_images %}{% menu_picture item.image item.name sizes="50vw" %}').render(
+                Context({'item': item}))
+        submit.assert_called_once_with(item.image.name)
+        self.assertIn(f'{url} 160w', html)
+        self.assertIn('type="image/webp"', html)
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'RIFF'))
+        self.assertTrue((self.media / thumbnails.derivative_name(item.image.name, 160, 'webp')).exists())
+        self.assertEqual(self.client.get(reverse('menu_image_thumbnail', args=[161, 'webp', item.image.name])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('menu_image_thumbnail', args=[160, 'webp', 'menu_items/other.png'])).status_code, 404)
+
+    def test_menu_uses_srcset_once_ready(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.create_item(image=self.image_upload())
+        self.client.force_login(User.objects.create_user('diner', password='pw'))
+        response = self.client.get(reverse('menu'))
+        self.assertContains(response, f'/media/{thumbnails.derivative_name(item.image.name, 320, "webp")} 320w')
+
+
+@task(name='tests.flaky', max_attempts=2)
+def flaky_task(fail=True):
+    if fail:
+        raise RuntimeError('printer offline')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        increment_cart_item(self.cart, make_menu_item())
+
+    def test_checkout_queues_the_receipt_instead_of_sending_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('checkout'), CHECKOUT_DATA)
+        order = Order.objects.get()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(list(Task.objects.values_list('name', 'payload')),
+                         [(send_order_receipt.task_name, {'order_id': order.pk})])
+        self.assertEqual(run_pending(), ['done'])
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertIn(order.token_number, mail.outbox[0].body)
+        self.assertEqual(run_pending(), [])
+
+    def test_orders_without_email_queue_nothing(self):
+        place_order(Order(user=self.user, customer_name='A', customer_phone='1'), self.cart)
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_RETRY_BACKOFF=10)
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        queued = flaky_task.enqueue()
+        self.assertEqual(run_pending(), ['queued'])
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('printer offline', queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertEqual(run_pending(), [])
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), ['failed'])
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    @override_settings(TASK_LOCK_TIMEOUT=60)
+    def test_claims_are_exclusive_until_the_lock_times_out(self):
+        flaky_task.enqueue(fail=False)
+        self.assertEqual(len(claim('worker-a')), 1)
+        self.assertEqual(claim('worker-b'), [])
+        Task.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        [task_row] = claim('worker-b')
+        self.assertEqual((task_row.locked_by, task_row.attempts), ('worker-b', 2))
+        self.assertEqual(run_task(task_row), 'done')
+
+
+class TaskWorkerTests(TransactionTestCase):
+    def test_worker_drains_the_queue_on_a_thread_pool(self):
+        user = User.objects.create_user('diner', password='pw')
+        for n in range(6):
+            Order.objects.create(user=user, customer_name=f'C{n}', customer_phone='1', customer_email=f'c{n}@example.com',
+                                 subtotal=Decimal('1'), tax=Decimal('0'), total=Decimal('1'))
+            send_order_receipt.enqueue(order_id=Order.objects.latest('pk').pk)
+        call_command('run_tasks', '--once', '--threads', '3', stdout=StringIO())
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {'done'})
+        self.assertEqual(len(mail.outbox), 6)
+
+
+class MenuSearchTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        mains = Category.objects.create(name='Mains')
+        desserts = Category.objects.create(name='Desserts')
+        self.chicken = make_menu_item('Chicken Burger', '9.00', mains)
+        self.beef = make_menu_item('Beef Burger', '10.00', mains)
+        self.soup = MenuItem.objects.create(category=mains, name='Chili Soup', description='Served with a burger bun', price=Decimal('6'))
+        self.creme = make_menu_item('Crème Brûlée', '5.00', desserts)
+        self.client.force_login(User.objects.create_user('diner', password='pw'))
+
+    def test_prefix_matching_and_ranking(self):
+        self.assertEqual(search_menu('bur'), [self.beef, self.chicken, self.soup])
+        self.assertEqual(search_menu('chi bur'), [self.chicken, self.soup])
+        self.assertEqual(search_menu('creme brul'), [self.creme])
+        self.assertEqual(search_menu('dessert'), [self.creme])
+        self.assertEqual(search_menu('pizza'), [])
+        self.assertEqual(search_menu('  '), [])
+
+    def test_index_is_updated_incrementally(self):
+        index = SearchIndex()
+        self.assertEqual(index.sync(get_catalog()), 4)
+        self.beef.name = self.beef.description = 'Beef Wrap'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beef.save()
+            self.soup.delete()
+        self.assertEqual(index.sync(get_catalog()), 2)
+        self.assertEqual(index.search('wrap'), [self.beef])
+        self.assertEqual(index.search('bur'), [self.chicken])
+        self.assertNotIn('soup', index.vocabulary)
+
+    def test_search_api_and_menu_page(self):
+        response = self.client.get(reverse('api_menu_search'), {'q': 'burg', 'limit': 1})
+        self.assertEqual(response.json()['items'], [{'id': self.beef.pk, 'name': 'Beef Burger', 'category': 'Mains', 'price': '10.00'}])
+        self.assertEqual(self.client.get(reverse('api_menu_search'), {'q': 'b', 'limit': 'x'}).status_code, 400)
+        response = self.client.get(reverse('menu'), {'q': 'creme'})
+        self.assertEqual(list(response.context['menu_items']), [self.creme])
+        self.assertContains(self.client.get(reverse('menu'), {'q': 'pizza'}), 'No items match')
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.user = User.objects.create_user('diner', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Mains')
+        self.fries, self.burger, self.cola, self.salad = (
+            make_menu_item(name, '3.00', category) for name in ('Fries', 'Burger', 'Cola', 'Salad')
+        )
+        self.cart = Cart.objects.create(user=self.user)
+
+    def order(self, *items, status='completed'):
+        for item in items:
+            increment_cart_item(self.cart, item)
+        order = Order(user=self.user, customer_name='A', customer_phone='1', status=status)
+        return place_order(order, self.cart)
+
+    def test_counts_are_updated_incrementally(self):
+        self.order(self.burger, self.fries)
+        self.order(self.burger, self.fries, self.cola)
+        self.order(self.burger, self.cola)
+        self.order(self.salad, self.cola, status='cancelled')
+        self.assertEqual(update_recommendations(settle_seconds=0), 4)
+        stats = ItemStats.objects.in_bulk()
+        self.assertEqual((stats[self.burger.pk].order_count, stats[self.burger.pk].quantity), (3, 3))
+        self.assertEqual(stats[self.fries.pk].recommended, [self.burger.pk, self.cola.pk])
+        self.assertNotIn(self.salad.pk, stats)
+
+        self.order(self.fries, self.cola)
+        self.order(self.fries, self.cola)
+        self.assertEqual(update_recommendations(settle_seconds=0), 2)
+        self.assertEqual(ItemStats.objects.get(pk=self.fries.pk).recommended, [self.cola.pk, self.burger.pk])
+        self.assertEqual(update_recommendations(settle_seconds=0), 0)
+
+    def test_recent_orders_wait_to_settle(self):
+        self.order(self.burger, self.fries)
+        self.assertEqual(update_recommendations(), 0)
+        Order.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(update_recommendations(), 1)
+
+    def test_home_features_popular_items_and_cart_recommends(self):
+        self.order(self.cola)
+        self.order(self.cola, self.burger)
+        self.order(self.cola, self.burger, self.fries)
+        update_recommendations(settle_seconds=0)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['featured_items'][:3], [self.cola, self.burger, self.fries])
+
+        increment_cart_item(self.cart, self.burger)
+        with CaptureQueriesContext(connection) as ctx:
+            recommended = recommendations_for([self.burger.pk], get_catalog())
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(recommended, [self.cola, self.fries])
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['recommended_items'], [self.cola, self.fries])
+        response = self.client.post(reverse('add_to_cart', args=[self.cola.pk]), {'next': reverse('cart')})
+        self.assertRedirects(response, reverse('cart'))
+
+    def test_order_items_keep_a_stable_key(self):
+        order = self.order(self.burger)
+        line = order.items.get()
+        self.assertEqual(line.menu_item, self.burger)
+        self.burger.delete()
+        line.refresh_from_db()
+        self.assertEqual((line.menu_item, line.menu_item_name), (None, 'Burger'))
+
+    def test_worker_keeps_one_periodic_refresh_queued(self):
+        queued = schedule_periodic()
+        self.assertEqual(schedule_periodic(), 0)
+        self.assertEqual(Task.objects.filter(name=refresh_recommendations.task_name).count(), 1)
+        self.assertEqual(Task.objects.count(), queued)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('regular', password='pw')
+        self.client.force_login(self.user)
+
+    def test_moves_closed_old_orders_in_batches(self):
+        old = [
+            make_order(self.user, days_ago=400, lines=2),
+            make_order(self.user, status='cancelled', days_ago=300, lines=2),
+            make_order(self.user, days_ago=200, lines=2),
+        ]
+        active = make_order(self.user, status='preparing', days_ago=400, lines=2)
+        recent = make_order(self.user, days_ago=10, lines=2)
+        self.assertEqual(archive_orders(days=180, batch_size=2), 3)
+        self.assertEqual(list(Order.objects.order_by('pk').values_list('pk', flat=True)), [active.pk, recent.pk])
+        archived = ArchivedOrder.objects.in_bulk()
+        self.assertEqual(sorted(archived), [order.pk for order in old])
+        self.assertEqual(archived[old[0].pk].token_number, old[0].token_number)
+        self.assertEqual([item.menu_item_name for item in archived[old[0].pk].items.order_by('pk')], ['Dish 0', 'Dish 1'])
+        self.assertEqual(OrderItem.objects.count(), 4)
+        self.assertEqual(archive_orders(days=180), 0)
+
+    def test_limit_stops_a_run_that_the_next_one_resumes(self):
+        for _ in range(3):
+            make_order(self.user, days_ago=400, lines=2)
+        out = StringIO()
+        call_command('archive_orders', '--older-than-days', '180', '--limit', '2', stdout=out)
+        self.assertIn('Archived 2 order(s).', out.getvalue())
+        self.assertEqual((Order.objects.count(), ArchivedOrder.objects.count()), (1, 2))
+        with self.settings(ORDER_ARCHIVE_AFTER_DAYS=180):
+            archive_old_orders()
+        self.assertEqual((Order.objects.count(), ArchivedOrder.objects.count()), (0, 3))
+
+    def test_history_and_receipts_include_archived_orders(self):
+        archived = [make_order(self.user, days_ago=400 - n, lines=2) for n in range(15)]
+        live = [make_order(self.user, days_ago=20 - n, lines=2) for n in range(15)]
+        archive_orders(days=180)
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('orders'), {'before': cursor, 'expand': '1'} if cursor else {'expand': '1'})
+            seen += [order.pk for order in response.context['orders']]
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [order.pk for order in reversed(archived + live)])
+        self.assertEqual(response.context['orders'][0].item_count, 2)
+        self.assertContains(response, 'Dish 1')
+
+        response = self.client.get(reverse('receipt', args=[archived[0].pk]))
+        self.assertContains(response, archived[0].token_number)
+        self.client.force_login(User.objects.create_user('other', password='pw'))
+        self.assertEqual(self.client.get(reverse('receipt', args=[archived[0].pk])).status_code, 404)
+
+    def test_sales_and_exports_still_count_archived_orders(self):
+        make_order(self.user, '30.00', days_ago=400, lines=2)
+        make_order(self.user, status='cancelled', days_ago=400, lines=2)
+        make_order(self.user, '12.00', days_ago=10, lines=2)
+        rebuild_daily_sales()
+        before = sorted(DailySalesSummary.objects.values_list('date', 'order_count', 'revenue'))
+        archive_orders(days=180)
+        self.assertEqual(sorted(DailySalesSummary.objects.values_list('date', 'order_count', 'revenue')), before)
+        rebuild_daily_sales()
+        self.assertEqual(sorted(DailySalesSummary.objects.values_list('date', 'order_count', 'revenue')), before)
+        self.assertEqual(sales_overview()['total_revenue'], Decimal('42.00'))
+        self.assertEqual(len(list(export_lines('csv'))), 1 + 6)
+
+
+SESSION_PROFILE = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    'SESSION_CACHE_ALIAS': 'default',
+    'AUTH_USER_CACHE_SECONDS': 30,
+}
+
+
+class SessionProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+        self.user = User.objects.create_user('regular', password='pw')
+
+    def page_queries(self, client, name):
+        client.get(reverse(name))
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_profile_skips_the_session_and_user_queries(self):
+        for name in ('orders', 'cart', 'api_recent_orders'):
+            client = Client()
+            client.force_login(self.user)
+            baseline = self.page_queries(client, name)
+            with self.settings(**SESSION_PROFILE):
+                client = Client()
+                client.force_login(self.user)
+                self.assertEqual(self.page_queries(client, name), baseline - 2, name)
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=30)
+    def test_requests_get_their_own_copy_until_the_user_changes(self):
+        backend = CachedModelBackend()
+        with self.assertNumQueries(1):
+            first = backend.get_user(self.user.pk)
+            first.first_name = 'Changed'
+            second = backend.get_user(self.user.pk)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, '')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertIsNone(backend.get_user(self.user.pk))
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=30)
+    def test_entries_expire(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        with mock.patch('restaurant.auth.time.monotonic', return_value=time.monotonic() + 31):
+            with self.assertNumQueries(1):
+                backend.get_user(self.user.pk)
+
+    def test_model_backend_sessions_move_to_the_cached_backend(self):
+        migration = import_module('restaurant.migrations.0010_move_sessions_to_cached_backend')
+        for profile in ({}, SESSION_PROFILE):
+            with self.settings(**profile):
+                client = Client()
+                client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+                self.assertEqual(client.get(reverse('orders')).status_code, 302)
+                migration.forwards(django_apps, None)
+                self.assertEqual(client.get(reverse('orders')).status_code, 200)
+
+
+class StartupTests(TransactionTestCase):
+    def test_admin_urls_load_on_first_use(self):
+        admin_urls = deferred_include('admin/', 'restaurant_system.admin_urls', 'admin')
+        root = URLResolver(RegexPattern(r'^/'), [admin_urls, path('', lambda request: None, name='home')])
+        self.assertEqual(root.reverse('home'), '')
+        self.assertFalse(admin_urls.loaded)
+        self.assertEqual(root.resolve('/admin/').url_name, 'index')
+        self.assertTrue(admin_urls.loaded)
+
+        staff = User.objects.create_user('owner', password='pw', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('admin:restaurant_order_changelist')).status_code, 200)
+
+    def test_warm_up_leaves_nothing_for_the_first_request(self):
+        make_menu_item('Warm Soup')
+        invalidate_catalog()
+        timings = warm_up()
+        self.assertEqual(set(timings), {'urls', 'templates', 'catalog'})
+        with self.assertNumQueries(0):
+            self.assertEqual([item.name for item in search_menu('soup')], ['Warm Soup'])
+        templates = Path(settings.BASE_DIR, 'restaurant', 'templates')
+        self.assertEqual(preload_templates(), len([f for f in templates.rglob('*') if f.is_file()]))
@@ -0,0 +1,179 @@
+"""
+Responsive thumbnails for menu item images.
+
+Each uploaded image gets derivatives at ``settings.THUMBNAIL_WIDTHS`` in
+WebP plus a JPEG fallback, stored on disk under
+``MEDIA_ROOT/thumbs/`` next to the original's path
+(``menu_items/burger.jpg`` -> ``thumbs/menu_items/burger-320w.webp``).
+Saving a menu item schedules them on a background thread after the commit,
+so the admin's request never waits on encoding. ``{% menu_picture %}``
+(templatetags/menu_images.py) emits a ``<picture>`` with ``srcset``; until an
+image's derivatives exist it points at the ``menu_image_thumbnail`` view,
+which encodes the one requested size on demand and caches it on disk.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+
+from .catalog import invalidate_catalog
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+FALLBACK_FORMAT = 'jpg'
+QUALITY = 80
+PREFIX = 'thumbs'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending_lock = threading.Lock()
+_pending = set()
+_ready = set()
+_generated = False
+
+
+def widths():
+    return tuple(getattr(settings, 'THUMBNAIL_WIDTHS', (160, 320, 640, 960)))
+
+
+def derivative_name(name, width, fmt):
+    path = PurePosixPath(name)
+    return str(PurePosixPath(PREFIX, path.parent, f'{path.stem}-{width}w.{fmt}'))
+
+
+def _marker(name):
+    # Written last by generate(), so its presence means the set is complete.
+    return default_storage.path(derivative_name(name, widths()[-1], FALLBACK_FORMAT))
+
+
+def is_ready(name):
+    marker = _marker(name)
+    if marker in _ready:
+        return True
+    if os.path.exists(marker):
+        _ready.add(marker)
+        return True
+    return False
+
+
+def _open(name):
+    # Pillow is imported on first use; it costs web workers more at boot than the rest of the app.
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def _encode(image, width, fmt):
+    from PIL import Image
+
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    if fmt == 'jpg' and image.mode != 'RGB':
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, 'white')
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, FORMATS[fmt][0], quality=QUALITY)
+    return buffer.getvalue()
+
+
+def _write(name, data):
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so a concurrent reader never sees half a file.
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def generate(name):
+    """Write every derivative of ``name``; returns their storage names."""
+    image = _open(name)
+    names = []
+    for fmt in [f for f in FORMATS if f != FALLBACK_FORMAT] + [FALLBACK_FORMAT]:
+        for width in widths():
+            names.append(derivative_name(name, width, fmt))
+            _write(names[-1], _encode(image, width, fmt))
+    _ready.add(_marker(name))
+    return names
+
+
+def derivative(name, width, fmt):
+    """Path of one derivative, encoding it first if it is not on disk yet."""
+    path = default_storage.path(derivative_name(name, width, fmt))
+    if not os.path.exists(path):
+        path = _write(derivative_name(name, width, fmt), _encode(_open(name), width, fmt))
+    return path
+
+
+def _run(name):
+    global _generated
+    try:
+        generate(name)
+        _generated = True
+    except OSError:
+        # A missing or unreadable original; templates keep using the lazy view.
+        logger.warning('Could not generate thumbnails for %s', name, exc_info=True)
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+            drained = _generated and not _pending
+            if drained:
+                _generated = False
+    if drained:
+        # Cached menu fragments still point at the lazy view; re-render them
+        # once for the whole batch (one menu render can queue every image).
+        invalidate_catalog()
+
+
+def _submit(name):
+    global _executor
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if not getattr(settings, 'THUMBNAIL_BACKGROUND', True):
+        _run(name)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+    _executor.submit(_run, name)
+
+
+def schedule(name):
+    """Generate ``name``'s derivatives in the background once the transaction commits."""
+    transaction.on_commit(lambda: _submit(name))
+
+
+def srcsets(name):
+    """``{format: srcset}`` for ``name``, scheduling its derivatives if they are missing."""
+    ready = is_ready(name)
+
+    def url(width, fmt):
+        if ready:
+            return default_storage.url(derivative_name(name, width, fmt))
+        return reverse('menu_image_thumbnail', args=[width, fmt, name])
+
+    result = {fmt: ', '.join(f'{url(width, fmt)} {width}w' for width in widths()) for fmt in FORMATS}
+    if not ready:
+        _submit(name)
+    return result
@@ -0,0 +1,93 @@
+"""
+Order token allocation.
+
+Tokens are handed out from a counter row in ``TokenSequence`` instead of
+reading the last order, so concurrent checkouts never race for the same
+number. Settings:
+
+    ORDER_TOKEN_START       first number of a fresh sequence (default 1001)
+    ORDER_TOKEN_DAILY_RESET restart numbering every day (default False)
+    ORDER_TOKEN_BLOCK_SIZE  numbers reserved per database round trip and
+                            served from memory by this process (default 1)
+
+A block is reserved in the caller's transaction, so it is only kept in
+memory once that transaction commits; if it rolls back, so does the
+counter, and the numbers go back to the database rather than being served
+again by this process.
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+GLOBAL_KEY = 'global'
+
+_blocks = {}
+_lock = threading.Lock()
+
+
+def _get_settings():
+    return (
+        getattr(settings, 'ORDER_TOKEN_START', 1001),
+        getattr(settings, 'ORDER_TOKEN_DAILY_RESET', False),
+        max(1, getattr(settings, 'ORDER_TOKEN_BLOCK_SIZE', 1)),
+    )
+
+
+def reserve_tokens(key, count, start=1001):
+    """Atomically reserve ``count`` numbers on sequence ``key``.
+
+    Returns the first number of the reserved range. The UPDATE runs first so
+    the write lock is taken before anything is read.
+    """
+    from .models import TokenSequence
+
+    while True:
+        try:
+            with transaction.atomic():
+                updated = TokenSequence.objects.filter(key=key).update(
+                    last_value=F('last_value') + count,
+                    updated_at=timezone.now(),
+                )
+                if not updated:
+                    TokenSequence.objects.create(key=key, last_value=start - 1 + count)
+                last_value = TokenSequence.objects.filter(key=key).values_list('last_value', flat=True).get()
+            return last_value - count + 1
+        except IntegrityError:
+            # Another worker created the row first; retry as an update.
+            continue
+
+
+def _keep_block(key, next_value, end):
+    with _lock:
+        _blocks.clear()
+        _blocks[key] = (next_value, end)
+
+
+def _next_number(key, start, block_size):
+    if block_size == 1:
+        return reserve_tokens(key, 1, start)
+    with _lock:
+        next_value, end = _blocks.get(key, (0, 0))
+        if next_value < end:
+            _blocks[key] = (next_value + 1, end)
+            return next_value
+    next_value = reserve_tokens(key, block_size, start)
+    transaction.on_commit(lambda: _keep_block(key, next_value + 1, next_value + block_size))
+    return next_value
+
+
+def next_token_number():
+    start, daily_reset, block_size = _get_settings()
+    if daily_reset:
+        today = timezone.localdate()
+        number = _next_number(today.isoformat(), start, block_size)
+        return f"#{today:%y%m%d}-{number}"
+    return f"#{_next_number(GLOBAL_KEY, start, block_size)}"
+
+
+def reset_token_blocks():
+    with _lock:
+        _blocks.clear()
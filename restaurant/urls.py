@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -8,15 +8,28 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(template_name='restaurant/registration/login.html'), name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('menu/', views.menu_view, name='menu'),
+    path('menu/images/<int:width>/<str:fmt>/<path:name>', views.menu_image_thumbnail, name='menu_image_thumbnail'),
     path('add-to-cart/<int:item_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/', views.cart_view, name='cart'),
     path('update-cart/<int:item_id>/', views.update_cart_item, name='update_cart'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('checkout/', views.checkout_view, name='checkout'),
     path('orders/', views.orders_view, name='orders'),
     path('receipt/<int:order_id>/', views.receipt_view, name='receipt'),
     path('analytics/', views.analytics_view, name='analytics'),
     
+    # Kitchen Display
+    path('kitchen/', views.kitchen_display, name='kitchen'),
+    path('kitchen/stream/', views.kitchen_stream, name='kitchen_stream'),
+    path('kitchen/advance/<int:order_id>/', views.kitchen_advance, name='kitchen_advance'),
+    
+    # Reports
+    path('manage/orders/export/', views.export_orders, name='export_orders'),
+    
+    # Performance
+    path('manage/performance/', views.performance_stats, name='performance_stats'),
+    
     # Category Management
     path('manage/categories/', views.category_list, name='category_list'),
     path('manage/categories/add/', views.category_add, name='category_add'),
@@ -26,8 +39,15 @@ urlpatterns = [
     # Menu Item Management
     path('manage/menu-items/', views.menuitem_list, name='menuitem_list'),
     path('manage/menu-items/add/', views.menuitem_add, name='menuitem_add'),
+    path('manage/menu-items/import/', views.menu_import, name='menu_import'),
     path('manage/menu-items/edit/<int:item_id>/', views.menuitem_edit, name='menuitem_edit'),
     path('manage/menu-items/delete/<int:item_id>/', views.menuitem_delete, name='menuitem_delete'),
     path('manage/menu-items/toggle/<int:item_id>/', views.menuitem_toggle_availability, name='menuitem_toggle'),
+    
+    # JSON API
+    path('api/menu/', api.menu, name='api_menu'),
+    path('api/menu/search/', api.menu_search, name='api_menu_search'),
+    path('api/orders/<str:token>/status/', api.order_status, name='api_order_status'),
+    path('api/my/orders/', api.recent_orders, name='api_recent_orders'),
 
 ]
@@ -2,20 +2,65 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout as auth_logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Sum, Q
-from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
-from .models import Category, MenuItem, Cart, CartItem, Order, OrderItem
-from .forms import RegisterForm, CheckoutForm, CategoryForm, MenuItemForm
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import condition, require_POST
+import hashlib
+import json
+from .models import Category, MenuItem, Cart, CartItem, Order
+from .forms import RegisterForm, CheckoutForm, CategoryForm, MenuItemForm, MenuImportForm
+from .archive import find_order, order_history_page
+from .catalog import get_catalog
+from .context_processors import request_cart_count
+from .exports import FORMATS, ExportError, export_filename, export_lines, parse_filters
+from .kitchen import event_stream, get_broker, serialize_order
+from .menu_import import MenuImportError, import_menu
+from .instrumentation import registry
+from .recommendations import recommendations_for
+from .routers import read_from_replica
+from .search import get_search_index
+from .rollups import ACTIVE_STATUSES, sales_overview
+from . import thumbnails
+from .services import (
+    CartOperationError, EmptyCartError, apply_cart_operations, calculate_totals, get_cart_items,
+    increment_cart_item, place_order, set_cart_item_quantity, split_totals,
+)
 
+def _has_pending_messages(request):
+    return len(messages.get_messages(request)) > 0
+
+def catalog_etag(request, *args, **kwargs):
+    # The page also carries the navbar (with the cart badge) and CSRF tokens,
+    # so the tag covers the viewer as well as the catalog version and filter.
+    if _has_pending_messages(request):
+        return None
+    key = '|'.join(str(part) for part in (
+        get_catalog().version,
+        request.GET.get('category', ''),
+        request.GET.get('q', ''),
+        request.user.pk,
+        request.user.is_staff,
+        request_cart_count(request),
+        request.META.get('CSRF_COOKIE', ''),
+    ))
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+def catalog_last_modified(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    return get_catalog().last_modified
+
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def home(request):
-    categories = Category.objects.all()[:6]
-    featured_items = MenuItem.objects.filter(is_available=True)[:6]
+    catalog = get_catalog()
     return render(request, 'restaurant/home.html', {
-        'categories': categories,
-        'featured_items': featured_items
+        'categories': catalog.categories[:6],
+        'featured_items': catalog.featured,
+        'catalog_version': catalog.version
     })
 
 def register_view(request):
@@ -31,100 +76,121 @@ def register_view(request):
     return render(request, 'restaurant/registration/register.html', {'form': form})
 
 @login_required
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def menu_view(request):
     category_filter = request.GET.get('category')
-    categories = Category.objects.all()
+    search_query = request.GET.get('q', '').strip()
+    catalog = get_catalog()
     
-    if category_filter:
-        menu_items = MenuItem.objects.filter(category_id=category_filter, is_available=True)
+    if search_query:
+        menu_items = get_search_index().search(search_query, limit=None)
+        if category_filter:
+            in_category = {item.pk for item in catalog.items_for(category_filter)}
+            menu_items = [item for item in menu_items if item.pk in in_category]
+    elif category_filter:
+        menu_items = catalog.items_for(category_filter)
     else:
-        menu_items = MenuItem.objects.filter(is_available=True)
+        menu_items = catalog.items
     
     return render(request, 'restaurant/menu.html', {
-        'categories': categories,
+        'categories': catalog.categories,
         'menu_items': menu_items,
-        'selected_category': category_filter
+        'selected_category': category_filter,
+        'search_query': search_query,
+        'catalog_version': catalog.version
     })
 
 @login_required
 def add_to_cart(request, item_id):
     menu_item = get_object_or_404(MenuItem, id=item_id, is_available=True)
     cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        menu_item=menu_item,
-        defaults={'quantity': 1}
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    increment_cart_item(cart, menu_item)
     
     messages.success(request, f'{menu_item.name} added to cart!')
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        return redirect(next_url)
     return redirect('menu')
 
 @login_required
 def cart_view(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'restaurant/cart.html', {'cart': cart})
+    subtotal, tax, total = split_totals(cart.total)
+    cart_items = get_cart_items(cart) if cart.item_count else []
+    return render(request, 'restaurant/cart.html', {
+        'cart': cart,
+        'cart_items': cart_items,
+        'recommended_items': recommendations_for([item.menu_item_id for item in cart_items], get_catalog()),
+        'subtotal': subtotal,
+        'tax': tax,
+        'total': total
+    })
 
 @login_required
 def update_cart_item(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    cart_item = get_object_or_404(CartItem.objects.select_related('cart', 'menu_item'), id=item_id, cart__user=request.user)
     
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity', 1))
+        set_cart_item_quantity(cart_item, quantity)
         if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
             messages.success(request, 'Cart updated!')
         else:
-            cart_item.delete()
             messages.success(request, 'Item removed from cart!')
     
     return redirect('cart')
 
 @login_required
 def remove_from_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
+    cart_item = get_object_or_404(CartItem.objects.select_related('cart', 'menu_item'), id=item_id, cart__user=request.user)
+    set_cart_item_quantity(cart_item, 0)
     messages.success(request, 'Item removed from cart!')
     return redirect('cart')
 
+@login_required
+@require_POST
+def cart_batch(request):
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with an "operations" list.'}, status=400)
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    try:
+        apply_cart_operations(cart, operations)
+    except CartOperationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'item_count': cart.item_count,
+        'total': str(cart.total),
+        'items': [
+            {'item': line.menu_item_id, 'quantity': line.quantity, 'subtotal': str(line.subtotal)}
+            for line in get_cart_items(cart)
+        ],
+    })
+
 @login_required
 def checkout_view(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
+    cart_items = get_cart_items(cart)
     
-    if not cart.items.exists():
+    if not cart_items:
         messages.warning(request, 'Your cart is empty!')
         return redirect('menu')
     
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            subtotal = cart.total
-            tax = subtotal * Decimal('0.10')
-            total = subtotal + tax
-            
             order = form.save(commit=False)
             order.user = request.user
-            order.subtotal = subtotal
-            order.tax = tax
-            order.total = total
-            order.status = 'completed'  # Set status to completed immediately
-            order.save()
-            
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    menu_item_name=cart_item.menu_item.name,
-                    quantity=cart_item.quantity,
-                    price=cart_item.menu_item.price,
-                    subtotal=cart_item.subtotal
-                )
+            # Goes to the kitchen display, which completes it once served;
+            # the sales rollup counts its revenue from then.
+            order.status = 'pending'
+            try:
+                place_order(order, cart)
+            except EmptyCartError:
+                messages.warning(request, 'Your cart is empty!')
+                return redirect('menu')
             
-            cart.items.all().delete()
             messages.success(request, f'Order placed successfully! Token: {order.token_number}')
             return redirect('receipt', order_id=order.id)
     else:
@@ -134,66 +200,101 @@ def checkout_view(request):
         }
         form = CheckoutForm(initial=initial_data)
     
-    subtotal = cart.total
-    tax = subtotal * Decimal('0.10')
-    total = subtotal + tax
+    subtotal, tax, total = calculate_totals(cart_items)
     
     return render(request, 'restaurant/checkout.html', {
         'form': form,
         'cart': cart,
+        'cart_items': cart_items,
         'subtotal': subtotal,
         'tax': tax,
         'total': total
     })
 
+ORDERS_PER_PAGE = 20
+
 @login_required
+@read_from_replica
 def orders_view(request):
-    orders = Order.objects.filter(user=request.user)
-    return render(request, 'restaurant/orders.html', {'orders': orders})
+    expand = request.GET.get('expand') == '1'
+    orders, next_cursor = order_history_page(request.user, request.GET.get('before'), ORDERS_PER_PAGE, expand)
+    return render(request, 'restaurant/orders.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'expand': expand
+    })
 
 @login_required
 def receipt_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = find_order(request.user, order_id)
+    if order is None:
+        raise Http404('No order matches the given query.')
     return render(request, 'restaurant/receipt.html', {'order': order})
 
 @login_required
+@read_from_replica
 def analytics_view(request):
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    month_start = today.replace(day=1)
-    
-    # Calculate revenues for completed orders only
-    daily_revenue = Order.objects.filter(
-        created_at__date=today,
-        status='completed'
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    weekly_revenue = Order.objects.filter(
-        created_at__date__gte=week_ago,
-        status='completed'
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    monthly_revenue = Order.objects.filter(
-        created_at__date__gte=month_start,
-        status='completed'
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    # Total stats for all orders
-    total_orders = Order.objects.filter(status='completed').count()
-    pending_orders = Order.objects.filter(status__in=['pending', 'preparing', 'ready']).count()
-    
-    # Calculate total revenue (all time)
-    total_revenue = Order.objects.filter(status='completed').aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    return render(request, 'restaurant/analytics.html', {
-        'daily_revenue': daily_revenue,
-        'weekly_revenue': weekly_revenue,
-        'monthly_revenue': monthly_revenue,
-        'total_orders': total_orders,
-        'pending_orders': pending_orders,
-        'total_revenue': total_revenue,
+    return render(request, 'restaurant/analytics.html', sales_overview())
+
+@staff_member_required
+def export_orders(request):
+    try:
+        start, end, statuses, export_format = parse_filters(
+            request.GET.get('from'), request.GET.get('to'),
+            request.GET.getlist('status'), request.GET.get('format', 'csv'),
+        )
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(
+        export_lines(export_format, start, end, statuses),
+        content_type=FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export_format, start, end)}"'
+    return response
+
+@staff_member_required
+def performance_stats(request):
+    if request.method == 'POST':
+        registry.reset()
+        messages.success(request, 'Performance statistics reset.')
+        return redirect('performance_stats')
+    return render(request, 'restaurant/performance.html', {
+        'views': registry.summary(),
+        'sample_rate': getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 1.0),
     })
 
+# Kitchen Display
+KITCHEN_NEXT_STATUS = {'pending': 'preparing', 'preparing': 'ready', 'ready': 'completed'}
+
+@staff_member_required
+def kitchen_display(request):
+    return render(request, 'restaurant/kitchen.html', {'next_status': KITCHEN_NEXT_STATUS})
+
+@staff_member_required
+async def kitchen_stream(request):
+    # Async so each connected screen is a coroutine, not a worker thread.
+    subscription = get_broker().subscribe()
+    try:
+        active_orders = [
+            serialize_order(order, order.items.all())
+            async for order in Order.objects.filter(status__in=ACTIVE_STATUSES).prefetch_related('items').order_by('created_at')
+        ]
+    except BaseException:
+        subscription.close()
+        raise
+    response = StreamingHttpResponse(event_stream(subscription, active_orders), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@staff_member_required
+@require_POST
+def kitchen_advance(request, order_id):
+    order = get_object_or_404(Order, id=order_id, status__in=KITCHEN_NEXT_STATUS)
+    order.status = KITCHEN_NEXT_STATUS[order.status]
+    order.save()
+    return JsonResponse({'id': order.id, 'status': order.status})
+
 # Category Management Views
 @staff_member_required
 def category_list(request):
@@ -252,6 +353,38 @@ def menuitem_add(request):
         form = MenuItemForm()
     return render(request, 'restaurant/menuitem_form.html', {'form': form, 'title': 'Add Menu Item'})
 
+def menu_image_thumbnail(request, width, fmt, name):
+    # Only derive sizes of images that belong to a menu item.
+    if width not in thumbnails.widths() or fmt not in thumbnails.FORMATS or not MenuItem.objects.filter(image=name).exists():
+        raise Http404('No such thumbnail.')
+    try:
+        path = thumbnails.derivative(name, width, fmt)
+    except FileNotFoundError:
+        raise Http404('The original image is missing.')
+    response = FileResponse(open(path, 'rb'), content_type=thumbnails.FORMATS[fmt][1])
+    patch_cache_control(response, public=True, max_age=86400)
+    return response
+
+@staff_member_required
+def menu_import(request):
+    plan = None
+    if request.method == 'POST':
+        form = MenuImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            dry_run = form.cleaned_data['dry_run']
+            try:
+                plan = import_menu(form.content, form.file_format, form.cleaned_data['withdraw_missing'], dry_run)
+            except MenuImportError as e:
+                for error in e.errors:
+                    form.add_error('file', error)
+            else:
+                if not dry_run:
+                    messages.success(request, f'Menu imported: {plan.summary()}.')
+                    return redirect('menuitem_list')
+    else:
+        form = MenuImportForm()
+    return render(request, 'restaurant/menu_import.html', {'form': form, 'plan': plan})
+
 @staff_member_required
 def menuitem_edit(request, item_id):
     menu_item = get_object_or_404(MenuItem, id=item_id)
@@ -0,0 +1,11 @@
+"""
+Admin URLs, imported the first time a URL under admin/ is resolved or
+reversed (see restaurant/startup.py). Under the lean serving profile the
+admin was not autodiscovered at boot, so that happens here.
+"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+app_name = 'admin'
+urlpatterns = admin.site.get_urls()
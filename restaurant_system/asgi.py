@@ -3,6 +3,10 @@ ASGI config for restaurant_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (e.g. ``uvicorn restaurant_system.asgi:application``)
+to use the kitchen display stream at /kitchen/stream/: it is an async view, so
+each connected screen is a coroutine on the event loop rather than a thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
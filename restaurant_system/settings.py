@@ -43,7 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'restaurant.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'restaurant.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +58,8 @@ ROOT_URLCONF = 'restaurant_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for the instrumentation middleware.
+        'BACKEND': 'restaurant.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -64,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'restaurant.context_processors.cart_count',
             ],
         },
     },
@@ -71,6 +75,28 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'restaurant_system.wsgi.application'
 
+# Lean serving profile for web workers, enabled with SERVING_PROFILE=lean
+# (see restaurant/startup.py):
+# - the admin is not autodiscovered at boot; its ModelAdmins and URLs load
+#   with the first request under /admin/;
+# - templates are compiled once per process by the cached loader, and
+#   wsgi.py preloads them and builds the menu catalog before the first
+#   request (WARM_UP_ON_START).
+# Measure it with `manage.py benchmark_startup`.
+SERVING_PROFILE = os.environ.get('SERVING_PROFILE', 'full')
+WARM_UP_ON_START = False
+
+if SERVING_PROFILE == 'lean':
+    INSTALLED_APPS[INSTALLED_APPS.index('django.contrib.admin')] = 'django.contrib.admin.apps.SimpleAdminConfig'
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    WARM_UP_ON_START = True
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -79,9 +105,109 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test database so concurrency tests can use real
+        # connections from several threads.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Production SQLite profile, enabled with SQLITE_PROFILE=production:
+# - WAL journaling, so readers never block the writer;
+# - synchronous=NORMAL, which is durable enough under WAL;
+# - a 64 MB page cache, 256 MB of memory-mapped I/O and in-memory temp tables;
+# - BEGIN IMMEDIATE, so write transactions take the lock up front instead of
+#   failing with "database is locked" when a read tries to upgrade;
+# - a 20 second busy timeout;
+# - persistent, health-checked connections.
+# restaurant/db.py retries the write transactions that still time out.
+SQLITE_PRODUCTION_PROFILE = {
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA cache_size=-64000;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA temp_store=MEMORY'
+        ),
+    },
+}
+
+if os.environ.get('SQLITE_PROFILE') == 'production':
+    DATABASES['default'].update(SQLITE_PRODUCTION_PROFILE)
+
+DB_BUSY_RETRIES = 3
+DB_BUSY_BACKOFF = 0.05
+
+# Read replica for reporting queries (see restaurant/routers.py). Locally, set
+# DB_REPLICA_PATH to a second SQLite file and refresh it from the primary
+# with `manage.py sync_replica`.
+if os.environ.get('DB_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DB_REPLICA_PATH'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['restaurant.routers.ReplicaRouter']
+
+# How long a client stays on the primary after a write, and how recent a
+# catalog change must be for the rebuild to skip the replica.
+REPLICA_LAG_SECONDS = 5
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# The menu catalog version (restaurant/catalog.py) lives in the cache named
+# by MENU_CATALOG_CACHE. Set it to 'shared' (or point 'shared' at Redis or
+# Memcached) when running several worker processes so they stay coherent.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+}
+
+MENU_CATALOG_CACHE = os.environ.get('MENU_CATALOG_CACHE', 'default')
+
+# Per-user navbar cart badge counts (Cart.cached_item_count).
+CART_COUNT_CACHE = os.environ.get('CART_COUNT_CACHE', 'default')
+
+
+# Sessions and authentication
+#
+# By default every logged-in request reads its session row and then its
+# User row. The production profile, enabled with SESSION_PROFILE=production,
+# serves both from memory:
+# - cached_db sessions, read from the cache named by SESSION_CACHE and
+#   written through to the database. Keep that cache shared between worker
+#   processes (the default 'shared'), or a logout in one worker leaves the
+#   session alive in the others;
+# - the logged-in User rows, kept per process for AUTH_USER_CACHE_SECONDS
+#   (restaurant/auth.py) and dropped when the user is saved; 0 turns it off.
+
+# Only the one backend, so a failed login runs the password hasher once.
+# Sessions that logged in through ModelBackend were moved onto it by
+# migration restaurant 0010.
+AUTHENTICATION_BACKENDS = ['restaurant.auth.CachedModelBackend']
+
+AUTH_USER_CACHE_SECONDS = 0
+
+if os.environ.get('SESSION_PROFILE') == 'production':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = os.environ.get('SESSION_CACHE', 'shared')
+    AUTH_USER_CACHE_SECONDS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +249,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Menu image derivatives (see restaurant/thumbnails.py), encoded on a
+# background thread after upload and cached under MEDIA_ROOT/thumbs/.
+THUMBNAIL_WIDTHS = (160, 320, 640, 960)
+THUMBNAIL_BACKGROUND = True
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -133,4 +264,44 @@ LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
-CRISPY_TEMPLATE_PACK = "bootstrap5"
\ No newline at end of file
+CRISPY_TEMPLATE_PACK = "bootstrap5"
+
+# Kitchen display event broker (see restaurant/kitchen.py). The in-process
+# broker only reaches screens connected to the same ASGI process.
+KITCHEN_BROKER = 'restaurant.kitchen.InProcessBroker'
+
+# Request instrumentation (see restaurant/instrumentation.py). One request
+# in twenty is sampled, which keeps the overhead negligible under load; raise
+# it while investigating, 0 turns it off. The Server-Timing header is only
+# sent under DEBUG or to staff.
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.05'))
+INSTRUMENTATION_DUPLICATE_THRESHOLD = 3
+
+# Background tasks (see restaurant/tasks.py), run by `manage.py run_tasks`.
+# Failed tasks are retried after TASK_RETRY_BACKOFF seconds, doubling each
+# time, up to TASK_MAX_ATTEMPTS; a task left running longer than
+# TASK_LOCK_TIMEOUT seconds by a dead worker is claimed again.
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = 30
+TASK_LOCK_TIMEOUT = 600
+
+# Featured items and "ordered together" lists (see restaurant/recommendations.py),
+# recounted on the task worker every RECOMMENDATIONS_INTERVAL seconds from
+# orders at least RECOMMENDATIONS_SETTLE_SECONDS old.
+RECOMMENDATIONS_INTERVAL = 300
+RECOMMENDATIONS_SETTLE_SECONDS = 60
+
+# Completed and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS are moved
+# to the archive tables (see restaurant/archive.py) by the task worker every
+# ORDER_ARCHIVE_INTERVAL seconds, or by `manage.py archive_orders`.
+ORDER_ARCHIVE_AFTER_DAYS = 180
+ORDER_ARCHIVE_INTERVAL = 3600
+
+# Outgoing mail (order receipts). Prints to the console unless configured.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'orders@restaurant.local')
+
+# Order token numbering (see restaurant/tokens.py)
+ORDER_TOKEN_START = 1001
+ORDER_TOKEN_DAILY_RESET = False
+ORDER_TOKEN_BLOCK_SIZE = 1
@@ -14,13 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from restaurant.startup import deferred_include
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    deferred_include('admin/', 'restaurant_system.admin_urls', 'admin'),
     path('', include('restaurant.urls')),
 ]
 if settings.DEBUG: